@@ -1,3 +1,5 @@
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -7,6 +9,8 @@ from app.routers import (
     story, teachback, lesson_plan,
     video_generation, answer_sheet_evaluator,doubt_solver,chatbot
 )
+from app.services.disk_lifecycle import run_sweeper, disk_usage_report
+from app.services.render_assets import prepare_render_assets
 
 app = FastAPI(title="Abhyaas Backend Full")
 
@@ -28,6 +32,21 @@ def home():
 def health():
     return {"status": "healthy"}
 
+# ✅ app/outputs housekeeping
+@app.on_event("startup")
+async def start_outputs_sweeper():
+    # keep a reference, a bare task can be garbage collected
+    app.state.outputs_sweeper = asyncio.create_task(run_sweeper())
+
+# ✅ video renderer sprites + fonts (built once, off the event loop)
+@app.on_event("startup")
+async def warm_render_assets():
+    app.state.render_assets = asyncio.create_task(asyncio.to_thread(prepare_render_assets, video_generation.RENDER_ASSET_VARIANTS))
+
+@app.get("/health/disk")
+def disk_health():
+    return disk_usage_report()
+
 # ✅ Routers
 app.include_router(auth.router, prefix="/auth")
 app.include_router(otp.router, prefix="/otp")
@@ -2,15 +2,28 @@ from fastapi import FastAPI, HTTPException, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from dotenv import load_dotenv
-import os, json, base64, re, logging
-from datetime import datetime
+import os, io, json, base64, re, logging, asyncio, hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
 from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
 
 router = APIRouter(tags=["answer_sheet_evaluator"])
 
 from openai import OpenAI
+from pdf2image.exceptions import (
+    PDFInfoNotInstalledError, PDFPageCountError, PDFSyntaxError, PopplerNotInstalledError,
+)
 from supabase import create_client
 
+from app.services.media_cache import cache_key, get_media_cache
+from app.services.storage_upload import upload_stream
+from app.services.sheet_image import (
+    SHEET_FORMAT, SHEET_MAX_EDGE, SHEET_PDF_DPI, SHEET_QUALITY,
+    is_pdf, pdf_file, pdf_page_count, prepare_pdf_page, prepare_sheet_image,
+)
+
 # Load .env from the project directory to avoid missing env when uvicorn cwd differs
 basedir = os.path.dirname(__file__)
 dotenv_path = os.path.join(basedir, ".env")
@@ -33,6 +46,25 @@ supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 BUCKET = "worksheet-files"
 
+# OpenAI requests in flight at once, across all batches on this worker
+OPENAI_CONCURRENCY = int(os.getenv("ANSWER_SHEET_OPENAI_CONCURRENCY", "4"))
+# threads for the blocking OpenAI / storage / database calls of batches
+ANSWER_SHEET_IO_THREADS = int(os.getenv("ANSWER_SHEET_IO_THREADS", "16"))
+# sheet photos decoded / shrunk at once (each full-size photo is ~40 MB decoded)
+ANSWER_SHEET_IMAGE_THREADS = int(os.getenv("ANSWER_SHEET_IMAGE_THREADS", str(os.cpu_count() or 1)))
+# PDF booklets: pages of one booklet being rasterised / OCR'd at once
+ANSWER_SHEET_PDF_CONCURRENCY = int(os.getenv("ANSWER_SHEET_PDF_CONCURRENCY", "4"))
+ANSWER_SHEET_PDF_MAX_PAGES = int(os.getenv("ANSWER_SHEET_PDF_MAX_PAGES", "60"))
+# batch results are written to the database this many at a time, or
+# after this long, whichever comes first
+ANSWER_SHEET_WRITE_BATCH = int(os.getenv("ANSWER_SHEET_WRITE_BATCH", "20"))
+ANSWER_SHEET_WRITE_DELAY = float(os.getenv("ANSWER_SHEET_WRITE_DELAY_SECONDS", "0.5"))
+
+# "two_step": transcribe, then grade the text (two calls)
+# "single": transcribe + grade in one vision call
+GRADING_MODES = ("two_step", "single")
+GRADING_MODE = os.getenv("ANSWER_SHEET_GRADING_MODE", "two_step").strip().lower()
+
 
 # Configure simple logging
 logging.basicConfig(level=logging.INFO)
@@ -64,7 +96,7 @@ def status_from_percentage(p: float) -> str:
     return "Needs Review"
 
 
-def extract_text_openai_vision(image_bytes: bytes) -> str:
+def extract_text_openai_vision(image_bytes: bytes, mime: str = "image/png") -> str:
     b64 = base64.b64encode(image_bytes).decode("utf-8")
 
     resp = client.chat.completions.create(
@@ -74,7 +106,7 @@ def extract_text_openai_vision(image_bytes: bytes) -> str:
             {"role": "system", "content": "Extract ALL text from the image. Return ONLY plain text. No markdown."},
             {"role": "user", "content": [
                 {"type": "text", "text": "Extract full text exactly as written. Do not skip lines."},
-                {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{b64}"}}
+                {"type": "image_url", "image_url": {"url": f"data:{mime};base64,{b64}"}}
             ]}
         ]
     )
@@ -116,16 +148,685 @@ OCR TEXT:
     return resp.choices[0].message.content
 
 
-def upload_to_supabase_storage(file_name: str, file_bytes: bytes, content_type: str):
-    supabase.storage.from_(BUCKET).upload(
-        file_name,
-        file_bytes,
-        {"content-type": content_type}
+def grade_single_pass(image_bytes: bytes, subject: str, total_marks: int, mime: str = "image/png"):
+    """
+    Transcription and grading in one vision call. Returns
+    (ocr_text, raw evaluation JSON) like the two-step path, or None when
+    the reply is unusable (callers then fall back to two steps).
+    """
+    b64 = base64.b64encode(image_bytes).decode("utf-8")
+
+    prompt = f"""
+You are an expert school teacher.
+
+The image is a student's answer sheet. First transcribe ALL of its text
+exactly as written (do not skip lines), then evaluate the answers using
+semantic understanding (not keyword matching).
+
+Return ONLY valid JSON exactly in this schema:
+
+{{
+  "ocr_text": "...",
+  "score": number,
+  "missing_points": ["..."],
+  "strengths": ["..."],
+  "weaknesses": ["..."],
+  "detailed_feedback": "..."
+}}
+
+TOTAL MARKS: {total_marks}
+SUBJECT: {subject}
+"""
+
+    resp = client.chat.completions.create(
+        model="gpt-4o-mini",
+        temperature=0.2,
+        response_format={"type": "json_object"},
+        messages=[
+            {"role": "system", "content": "Return ONLY JSON. No markdown."},
+            {"role": "user", "content": [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": f"data:{mime};base64,{b64}"}}
+            ]}
+        ]
     )
 
+    data = safe_json_load(resp.choices[0].message.content or "")
+    if not isinstance(data, dict) or not str(data.get("ocr_text") or "").strip():
+        return None
+
+    ocr_text = str(data.pop("ocr_text")).strip()
+    return ocr_text, json.dumps(data)
+
+
+def check_grading_mode(mode: str) -> str:
+    mode = (mode or GRADING_MODE).strip().lower()
+    if mode not in GRADING_MODES:
+        raise HTTPException(status_code=400, detail=f"grading_mode must be one of: {', '.join(GRADING_MODES)}")
+    return mode
+
+
+def upload_to_supabase_storage(file_name: str, file_bytes: bytes, content_type: str):
+    # sent in chunks straight from the buffer already read for OCR
+    upload_stream(BUCKET, file_name, io.BytesIO(file_bytes), len(file_bytes), content_type)
+
     return supabase.storage.from_(BUCKET).get_public_url(file_name)
 
 
+def parse_evaluation(raw: str) -> dict:
+    """evaluate_with_ai's JSON, or the raw reply as feedback with score 0."""
+    return safe_json_load(raw) or {
+        "score": 0,
+        "missing_points": [],
+        "strengths": [],
+        "weaknesses": [],
+        "detailed_feedback": raw
+    }
+
+
+def join_pages(pages) -> str:
+    """OCR text of a sheet; booklet pages are marked so the grader sees the breaks."""
+    if len(pages) == 1:
+        return pages[0]
+    return "\n\n".join(f"[Page {i}]\n{text}" for i, text in enumerate(pages, 1))
+
+
+def evaluation_row(student_name: str, subject: str, total_marks: int, ocr_text: str, ai: dict,
+                   file_name: str, file_url: str, ocr_pages=None) -> dict:
+    """
+    evaluations row for a graded sheet (score clamped to total_marks).
+    ocr_pages keeps the text per page, so a regrade never needs the file.
+    """
+    score = int(ai.get("score", 0))
+    score = max(0, min(score, total_marks))
+
+    percentage = round((score / total_marks) * 100, 2) if total_marks > 0 else 0
+
+    return {
+        "student_name": student_name,
+        "subject": subject,
+        "total_marks": total_marks,
+        "score": score,
+        "percentage": percentage,
+        "grade": grade_from_percentage(percentage),
+        "status": status_from_percentage(percentage),
+        "confidence": 98.4,
+        "time_saved": "12m",
+
+        "extracted_answers": ocr_text,
+        "ocr_text": ocr_text,
+        "ocr_pages": ocr_pages if ocr_pages is not None else [ocr_text],
+        "missing_points": ai.get("missing_points", []),
+        "strengths": ai.get("strengths", []),
+        "weaknesses": ai.get("weaknesses", []),
+        "detailed_feedback": ai.get("detailed_feedback", ""),
+
+        "file_name": file_name,
+        "file_url": file_url,
+        "created_at": datetime.utcnow().isoformat()
+    }
+
+
+# ----------------------------
+# Result cache
+# ----------------------------
+# OCR text per file (sha256 of the upload) and grading JSON per
+# (OCR text, subject, total marks, prompt) in the media cache, so a
+# re-uploaded sheet costs no OpenAI calls. Bump a version when its
+# prompt changes so old results are not reused.
+OCR_PROMPT_VERSION = 1
+GRADING_PROMPT_VERSIONS = {"two_step": 1, "single": 1}
+
+
+def file_digest(file_bytes: bytes) -> str:
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+def ocr_cache_key(digest: str) -> str:
+    # what OpenAI sees depends on the preprocessing too
+    return cache_key(
+        "sheet-ocr", OCR_PROMPT_VERSION, digest,
+        SHEET_MAX_EDGE, SHEET_FORMAT, SHEET_QUALITY, SHEET_PDF_DPI
+    )
+
+
+def grading_cache_key(ocr_text: str, subject: str, total_marks: int, grading_mode: str) -> str:
+    text_hash = hashlib.sha256(ocr_text.encode("utf-8")).hexdigest()
+    return cache_key(
+        "sheet-grade", grading_mode, GRADING_PROMPT_VERSIONS[grading_mode],
+        text_hash, subject, int(total_marks)
+    )
+
+
+def cached_grading(ocr_text: str, subject: str, total_marks: int, grading_mode: str = GRADING_MODE):
+    """Raw grading JSON of this text from the cache, or None. Single-pass mode also takes two-step results."""
+    cache = get_media_cache()
+    modes = ("single", "two_step") if grading_mode == "single" else ("two_step",)
+
+    for mode in modes:
+        hit = cache.get_json(grading_cache_key(ocr_text, subject, total_marks, mode))
+        if hit:
+            return hit["raw"]
+    return None
+
+
+def store_grading(ocr_text: str, subject: str, total_marks: int, grading_mode: str, raw: str):
+    # a reply that is not JSON is saved as feedback with score 0; don't keep that
+    if isinstance(safe_json_load(raw), dict):
+        get_media_cache().put_json(grading_cache_key(ocr_text, subject, total_marks, grading_mode), {"raw": raw})
+
+
+# ----------------------------
+# Batch engine
+# ----------------------------
+
+_io_pool = ThreadPoolExecutor(max_workers=ANSWER_SHEET_IO_THREADS, thread_name_prefix="answer-sheet")
+_image_pool = ThreadPoolExecutor(max_workers=ANSWER_SHEET_IMAGE_THREADS, thread_name_prefix="answer-sheet-image")
+_openai_slots = asyncio.Semaphore(OPENAI_CONCURRENCY)
+
+
+async def run_io(fn, *args):
+    """Runs a blocking call (storage / database) on the batch thread pool."""
+    return await asyncio.get_running_loop().run_in_executor(_io_pool, partial(fn, *args))
+
+
+async def prepare_image(file_bytes: bytes):
+    """prepare_sheet_image on the image pool: (bytes, mime) to send for OCR."""
+    return await asyncio.get_running_loop().run_in_executor(_image_pool, prepare_sheet_image, file_bytes)
+
+
+async def call_openai(fn, *args):
+    """run_io for OpenAI calls, at most OPENAI_CONCURRENCY at a time."""
+    async with _openai_slots:
+        return await run_io(fn, *args)
+
+
+async def ocr_pdf_pages(file_bytes: bytes):
+    """
+    OCR text of every page of a PDF booklet, in page order. Pages are
+    rasterised one at a time (never the whole booklet in memory), at
+    most ANSWER_SHEET_PDF_CONCURRENCY of them in flight.
+    """
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(ANSWER_SHEET_PDF_CONCURRENCY)
+
+    with pdf_file(file_bytes) as path:
+        try:
+            pages = await loop.run_in_executor(_image_pool, pdf_page_count, path)
+        except (PDFInfoNotInstalledError, PopplerNotInstalledError):
+            # poppler-utils missing on the host
+            logger.error("PDF upload rejected: poppler is not installed")
+            raise HTTPException(status_code=503, detail="PDF support not available on this server")
+        except (PDFPageCountError, PDFSyntaxError):
+            raise HTTPException(status_code=400, detail="Could not read the PDF")
+
+        if pages > ANSWER_SHEET_PDF_MAX_PAGES:
+            raise HTTPException(status_code=400, detail=f"PDF has {pages} pages, max is {ANSWER_SHEET_PDF_MAX_PAGES}")
+
+        async def page(n):
+            async with slots:
+                image, mime = await loop.run_in_executor(_image_pool, prepare_pdf_page, path, n)
+                return await call_openai(extract_text_openai_vision, image, mime)
+
+        return list(await asyncio.gather(*(page(n) for n in range(1, pages + 1))))
+
+
+async def read_sheet(file_bytes: bytes, subject: str, total_marks: int, grading_mode: str = GRADING_MODE):
+    """
+    OCR of an uploaded sheet: a photo / scan or a multi-page PDF.
+    Returns (ocr_pages, raw evaluation JSON or None); the evaluation is
+    only there when single-pass mode graded the image in the same call
+    (PDFs are always read page by page, then graded once). A file read
+    before comes from the cache.
+    """
+    cache = get_media_cache()
+    ocr_key = ocr_cache_key(file_digest(file_bytes))
+
+    hit = cache.get_json(ocr_key)
+    if hit:
+        return hit["ocr_pages"], None
+
+    raw = None
+    if is_pdf(file_bytes):
+        pages = await ocr_pdf_pages(file_bytes)
+    else:
+        # the original goes to storage, a smaller grayscale copy to OpenAI
+        image, mime = await prepare_image(file_bytes)
+
+        graded = None
+        if grading_mode == "single":
+            graded = await call_openai(grade_single_pass, image, subject, total_marks, mime)
+
+        if graded:
+            pages, raw = [graded[0]], graded[1]
+            store_grading(graded[0], subject, total_marks, "single", raw)
+        else:
+            pages = [await call_openai(extract_text_openai_vision, image, mime)]
+
+    if any(pages):
+        cache.put_json(ocr_key, {"ocr_pages": pages})
+    return pages, raw
+
+
+async def grade_text(ocr_text: str, subject: str, total_marks: int, grading_mode: str = GRADING_MODE) -> str:
+    """evaluate_with_ai through the result cache."""
+    raw = cached_grading(ocr_text, subject, total_marks, grading_mode)
+    if raw is None:
+        raw = await call_openai(evaluate_with_ai, ocr_text, subject, total_marks)
+        store_grading(ocr_text, subject, total_marks, "two_step", raw)
+    return raw
+
+
+def batch_file_name(batch_id, file_name: str):
+    """(safe name, storage object name) of a batch upload."""
+    safe_name = re.sub(r"[^a-zA-Z0-9._-]", "_", file_name or "worksheet.png")
+    return safe_name, f"{batch_id}_{int(datetime.utcnow().timestamp())}_{safe_name}"
+
+
+async def store_batch_file(batch_id, item: dict):
+    """
+    (storage object name, public URL) of a batch file. Files stored by an
+    earlier run of the batch (resume) are not uploaded again.
+    """
+    if item.get("file_path"):
+        return item["file_path"], item["file_url"]
+
+    _, final_name = batch_file_name(batch_id, item["file_name"])
+    file_url = await run_io(upload_to_supabase_storage, final_name, item["file_bytes"], item["content_type"])
+    return final_name, file_url
+
+
+async def grade_file(file_bytes: bytes, subject: str, total_marks: int, grading_mode: str = GRADING_MODE):
+    """OCR + grading of one batch file. Returns (ocr_pages, raw evaluation JSON)."""
+    ocr_pages, raw = await read_sheet(file_bytes, subject, total_marks, grading_mode)
+    if raw is None:
+        raw = await grade_text(join_pages(ocr_pages), subject, total_marks, grading_mode)
+    return ocr_pages, raw
+
+
+def batch_evaluation_row(batch_id, file_name: str, graded, subject: str, total_marks: int) -> dict:
+    """evaluations row of a graded batch file."""
+    ocr_pages, raw, file_url = graded
+    safe_name, _ = batch_file_name(batch_id, file_name)
+
+    return evaluation_row(
+        safe_name.replace("_", " ").split(".")[0], subject, total_marks,
+        join_pages(ocr_pages), parse_evaluation(raw), file_name, file_url, ocr_pages
+    )
+
+
+class BatchWriter:
+    """
+    Buffers the database writes of a batch: graded items' evaluations
+    rows and every item's batch_items state. A flush is one multi-row
+    evaluations insert plus one batch_items upsert (which also links
+    the evaluations), done when `size` items are waiting, `delay`
+    seconds after the first one, or once every item has been written.
+    """
+
+    def __init__(self, expected: int, size: int = ANSWER_SHEET_WRITE_BATCH, delay: float = ANSWER_SHEET_WRITE_DELAY):
+        self.expected = expected  # items still to be written
+        self.size = size
+        self.delay = delay
+        self.pending = []  # (batch_items row, state fields, evaluations row or None, future)
+        self._timer = None
+
+    async def write(self, item: dict, fields: dict, evaluation: dict = None):
+        """
+        Queues an item's state (and evaluation) and waits for its flush.
+        Returns the saved evaluation. Raises if the evaluation could not
+        be saved (the item is then recorded as failed) or the item's
+        state could not be recorded (its evaluation is then removed
+        again, so a resume does not grade it twice).
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((item, fields, evaluation, future))
+        self.expected -= 1
+
+        if len(self.pending) >= self.size or self.expected <= 0:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.delay, self.flush)
+
+        return await future
+
+    def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        writes, self.pending = self.pending, []
+        if writes:
+            asyncio.ensure_future(self._flush(writes))
+
+    async def _flush(self, writes):
+        """Saves writes and settles every one of their futures, whatever happens."""
+        outcomes = None
+        try:
+            outcomes = await self._save(writes)
+        except Exception as e:
+            logger.exception("could not write %d batch items", len(writes))
+            outcomes = [e] * len(writes)
+        finally:
+            if outcomes is None:  # cancelled
+                outcomes = [RuntimeError("batch write was cancelled")] * len(writes)
+
+            for (*_, future), outcome in zip(writes, outcomes):
+                if future.done():
+                    continue
+                if isinstance(outcome, Exception):
+                    future.set_exception(outcome)
+                else:
+                    future.set_result(outcome)
+
+    async def _save(self, writes):
+        """One evaluations insert + one batch_items upsert. Returns each write's evaluation or error."""
+        evaluations = [e for _, _, e, _ in writes if e is not None]
+        saved, error = [], None
+        if evaluations:
+            try:
+                saved = (await run_io(supabase.table("evaluations").insert(evaluations).execute)).data or []
+                if len(saved) != len(evaluations):
+                    # rows can't be matched to items: drop the ones we know of
+                    await self._discard(saved)
+                    raise RuntimeError(f"evaluations insert returned {len(saved)} rows for {len(evaluations)}")
+            except Exception as e:
+                logger.exception("could not save %d evaluations", len(evaluations))
+                error = e
+
+        rows, outcomes = [], []
+        saved_rows = iter(saved)
+        for item, fields, evaluation, _ in writes:
+            row = {k: item.get(k) for k in BATCH_ITEM_COLUMNS}
+            row.update(fields)
+
+            outcome = None
+            if evaluation is not None:
+                if error is None:
+                    outcome = next(saved_rows)
+                    row["evaluation_id"] = outcome["id"]
+                else:
+                    outcome = error
+                    row.update(status="failed", error=str(error))
+
+            rows.append(row)
+            outcomes.append(outcome)
+
+        try:
+            await run_io(supabase.table("batch_items").upsert(rows).execute)
+        except Exception as e:
+            logger.exception("could not record the state of %d batch items", len(rows))
+            # the items still look unfinished: drop their evaluations so
+            # a resume re-grades them without leaving duplicates behind
+            await self._discard([o for o in outcomes if isinstance(o, dict)])
+            return [e] * len(writes)
+
+        return outcomes
+
+    async def _discard(self, evaluations):
+        if not evaluations:
+            return
+        ids = [e["id"] for e in evaluations]
+        try:
+            await run_io(supabase.table("evaluations").delete().in_("id", ids).execute)
+        except Exception:
+            logger.exception("could not remove evaluations %s of unrecorded batch items", ids)
+
+
+async def run_batch_items(job: "BatchJob", items, subject: str, total_marks: int, grading_mode: str = GRADING_MODE):
+    """
+    Grades every batch item (batch_items row + "file_bytes") concurrently
+    and records each one's outcome on its row as it finishes; one sheet
+    failing does not stop the others. Files with the same bytes are read,
+    graded and uploaded once; each still gets its own evaluation. Returns
+    (saved evaluations, failures), both in item order.
+    """
+    batch_id = job.batch_id
+    digests = [file_digest(item["file_bytes"]) for item in items]
+    writer = BatchWriter(len(items))
+
+    stored, graded = {}, {}  # sha256 -> task for the first item with these bytes
+    for item, digest in zip(items, digests):
+        if digest not in graded:
+            stored[digest] = asyncio.ensure_future(store_batch_file(batch_id, item))
+            graded[digest] = asyncio.ensure_future(grade_file(item["file_bytes"], subject, total_marks, grading_mode))
+
+    if len(graded) < len(items):
+        logger.info("batch %s: %d duplicate files", batch_id, len(items) - len(graded))
+
+    async def one(item, digest):
+        file_name = item["file_name"]
+        # the upload and the grading run alongside; wait for both so
+        # neither outcome goes unobserved
+        upload, result = await asyncio.gather(stored[digest], graded[digest], return_exceptions=True)
+        # kept even when grading failed, so a resume needs no new upload
+        fields = {} if isinstance(upload, BaseException) else {"file_path": upload[0], "file_url": upload[1]}
+
+        evaluation = None
+        try:
+            for outcome in (result, upload):
+                if isinstance(outcome, BaseException):
+                    raise outcome
+
+            evaluation = batch_evaluation_row(batch_id, file_name, (*result, upload[1]), subject, total_marks)
+            fields.update(status="done", error=None)
+        except Exception as e:
+            logger.exception("batch %s: %s failed", batch_id, file_name)
+            fields.update(status="failed", error=str(e))
+
+        try:
+            saved = await writer.write(item, fields, evaluation)
+        except Exception as e:
+            fields.update(status="failed", error=str(e))
+
+        if fields["status"] == "done":
+            fields["evaluation_id"] = saved["id"]
+        else:
+            saved = {"file_name": file_name, "error": fields["error"]}
+
+        job.emit(*batch_item_event({**item, **fields, "evaluations": saved if fields["status"] == "done" else None}))
+        return saved
+
+    done = await asyncio.gather(*(one(item, digest) for item, digest in zip(items, digests)))
+
+    results = [d for d in done if "error" not in d]
+    failed = [d for d in done if "error" in d]
+    return results, failed
+
+
+# ----------------------------
+# Batch jobs
+# ----------------------------
+# A batch is graded by a task on this worker's event loop; the request
+# returns at once. Every file has a batch_items row whose status goes
+# queued -> done | failed (with evaluation_id / error), and the files go
+# to storage so a resume can re-run the failed / unfinished items.
+
+BATCH_EVENTS_POLL_SECONDS = float(os.getenv("ANSWER_SHEET_EVENTS_POLL_SECONDS", "2"))
+BATCH_EVENTS_HEARTBEAT_SECONDS = 15
+# a running job stamps batches.heartbeat_at this often; a batch with
+# unfinished items and no stamp for BATCH_STALL_SECONDS has no job left
+# anywhere (e.g. its worker was restarted) and needs a resume
+BATCH_JOB_HEARTBEAT_SECONDS = 30
+BATCH_STALL_SECONDS = 3 * BATCH_JOB_HEARTBEAT_SECONDS
+
+BATCH_ITEM_COLUMNS = ("id", "batch_id", "position", "file_name", "status", "error",
+                      "file_path", "file_url", "evaluation_id")
+BATCH_ITEM_FIELDS = ",".join(BATCH_ITEM_COLUMNS)
+
+
+class BatchJob:
+    """One batch being graded on this worker, with the events sent to its SSE subscribers."""
+
+    def __init__(self, batch_id):
+        self.batch_id = batch_id
+        self.events = []  # (event name, data), replayed to every subscriber
+        self.finished = False
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def emit(self, name: str, data: dict):
+        self.events.append((name, data))
+        self._changed.set()
+
+    async def follow(self):
+        """
+        Every event from the first one on, waiting for new ones until the
+        job ends. Yields None when nothing happened for a while (heartbeat).
+        """
+        k = 0
+        while True:
+            while k < len(self.events):
+                yield self.events[k]
+                k += 1
+            if self.finished:
+                return
+
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), BATCH_EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield None
+
+
+_batch_jobs = {}  # batch_id -> BatchJob running on this worker
+
+
+def batch_job_alive(batch: dict) -> bool:
+    """True while some worker's job is grading this batch (its heartbeat is recent)."""
+    if batch.get("status") != "processing" or not batch.get("heartbeat_at"):
+        return False
+
+    beat = datetime.fromisoformat(batch["heartbeat_at"])
+    if beat.tzinfo is None:
+        beat = beat.replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - beat).total_seconds() < BATCH_STALL_SECONDS
+
+
+async def stamp_batch_heartbeat(batch_id):
+    """Runs alongside a batch job, so other workers can tell it is alive."""
+    while True:
+        try:
+            await run_io(
+                supabase.table("batches")
+                .update({"heartbeat_at": datetime.utcnow().isoformat()})
+                .eq("id", batch_id)
+                .execute
+            )
+        except Exception as e:
+            logger.warning("batch %s: heartbeat not recorded: %s", batch_id, e)
+        await asyncio.sleep(BATCH_JOB_HEARTBEAT_SECONDS)
+
+
+async def run_batch_job(job: BatchJob, items, subject: str, total_marks: int, grading_mode: str,
+                        failed_before: int = 0):
+    """Grades the items, then records the batch's status ("partial" if any item failed, counting failed_before)."""
+    batch_id = job.batch_id
+    heartbeat = asyncio.ensure_future(stamp_batch_heartbeat(batch_id))
+    try:
+        results, failed = await run_batch_items(job, items, subject, total_marks, grading_mode)
+    except Exception as e:
+        logger.exception("batch %s failed", batch_id)
+        results, failed = [], [{"error": str(e)}]
+    finally:
+        heartbeat.cancel()
+
+    status = "partial" if failed or failed_before else "done"
+    try:
+        await run_io(supabase.table("batches").update({"status": status}).eq("id", batch_id).execute)
+    except Exception:
+        logger.exception("batch %s: could not record its status", batch_id)
+
+    job.emit("done", {"batch_id": batch_id, "status": status, "done": len(results), "failed": len(failed)})
+    job.finished = True
+    _batch_jobs.pop(batch_id, None)
+    return results, failed
+
+
+def start_batch_job(batch_id, items, subject: str, total_marks: int, grading_mode: str,
+                    failed_before: int = 0, job: BatchJob = None) -> BatchJob:
+    """
+    Starts grading items in the background (in job, if one was already
+    registered); the job is findable in _batch_jobs while it runs.
+    """
+    job = job or BatchJob(batch_id)
+    _batch_jobs[batch_id] = job
+    job.task = asyncio.ensure_future(run_batch_job(job, items, subject, total_marks, grading_mode, failed_before))
+    return job
+
+
+def batch_item_event(item: dict):
+    """SSE event of a finished batch_items row (joined with its evaluation)."""
+    return "item", {
+        "item_id": item["id"],
+        "position": item.get("position"),
+        "file_name": item.get("file_name"),
+        "status": item["status"],
+        "error": item.get("error"),
+        "evaluation": item.get("evaluations"),
+    }
+
+
+async def poll_batch_events(batch_id):
+    """
+    Events of a batch that is not running on this worker (finished, or
+    running on another one), read from batch_items until no item is left
+    to grade. Ends with "stalled" when items are left but no job is
+    grading them any more (see BATCH_STALL_SECONDS); /resume picks them up.
+    """
+    sent = set()
+    idle = 0.0
+    while True:
+        batch = (await run_io(
+            supabase.table("batches").select("status,heartbeat_at").eq("id", batch_id).execute
+        )).data
+        items = (await run_io(
+            supabase.table("batch_items")
+            .select(f"{BATCH_ITEM_FIELDS},evaluations(*)")
+            .eq("batch_id", batch_id)
+            .order("position")
+            .execute
+        )).data
+
+        for item in items:
+            if item["status"] in ("done", "failed") and item["id"] not in sent:
+                sent.add(item["id"])
+                idle = 0.0
+                yield batch_item_event(item)
+
+        if all(item["status"] in ("done", "failed") for item in items):
+            failed = sum(item["status"] == "failed" for item in items)
+            yield "done", {
+                "batch_id": batch_id,
+                "status": "partial" if failed else "done",
+                "done": len(items) - failed,
+                "failed": failed,
+            }
+            return
+
+        if batch_id not in _batch_jobs and not (batch and batch_job_alive(batch[0])):
+            pending = [item for item in items if item["status"] not in ("done", "failed")]
+            yield "stalled", {
+                "batch_id": batch_id,
+                "pending": len(pending),
+                "resume_url": f"/answer-sheet/batch/{batch_id}/resume",
+            }
+            return
+
+        await asyncio.sleep(BATCH_EVENTS_POLL_SECONDS)
+        idle += BATCH_EVENTS_POLL_SECONDS
+        if idle >= BATCH_EVENTS_HEARTBEAT_SECONDS:
+            idle = 0.0
+            yield None
+
+
+def sse_message(event) -> str:
+    if event is None:
+        return ": ping\n\n"
+    name, data = event
+    return f"event: {name}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
 # ----------------------------
 # MAIN ENDPOINTS
 # ----------------------------
@@ -137,36 +838,27 @@ async def evaluate(
     student_name: str = Form("Unknown"),
     subject: str = Form("General"),
     save_file: bool = Form(True),
+    grading_mode: str = Form(GRADING_MODE),
 ):
     try:
+        grading_mode = check_grading_mode(grading_mode)
+
         file_bytes = await file.read()
         if not file_bytes:
             raise HTTPException(status_code=400, detail="Empty file")
 
-        # OCR (OpenAI Vision)
-        ocr_text = extract_text_openai_vision(file_bytes)
+        # OCR (OpenAI Vision; PDF booklets page by page). Single-pass
+        # mode grades an image in the same call.
+        ocr_pages, raw = await read_sheet(file_bytes, subject, total_marks, grading_mode)
+        ocr_text = join_pages(ocr_pages)
         if not ocr_text:
             raise HTTPException(status_code=400, detail="OCR failed. Try clearer image.")
 
         # Evaluate
-        raw = evaluate_with_ai(ocr_text, subject, total_marks)
-        ai = safe_json_load(raw)
-
-        if not ai:
-            ai = {
-                "score": 0,
-                "missing_points": [],
-                "strengths": [],
-                "weaknesses": [],
-                "detailed_feedback": raw
-            }
-
-        score = int(ai.get("score", 0))
-        score = max(0, min(score, total_marks))
+        if raw is None:
+            raw = await grade_text(ocr_text, subject, total_marks, grading_mode)
 
-        percentage = round((score / total_marks) * 100, 2) if total_marks > 0 else 0
-        grade = grade_from_percentage(percentage)
-        status = status_from_percentage(percentage)
+        ai = parse_evaluation(raw)
 
         # Optional upload file to storage
         file_url = None
@@ -176,28 +868,9 @@ async def evaluate(
             file_url = upload_to_supabase_storage(final_name, file_bytes, file.content_type or "image/png")
 
         # Save in DB
-        saved = supabase.table("evaluations").insert({
-            "student_name": student_name,
-            "subject": subject,
-            "total_marks": total_marks,
-            "score": score,
-            "percentage": percentage,
-            "grade": grade,
-            "status": status,
-            "confidence": 98.4,
-            "time_saved": "12m",
-
-            "extracted_answers": ocr_text,
-            "ocr_text": ocr_text,
-            "missing_points": ai.get("missing_points", []),
-            "strengths": ai.get("strengths", []),
-            "weaknesses": ai.get("weaknesses", []),
-            "detailed_feedback": ai.get("detailed_feedback", ""),
-
-            "file_name": file.filename,
-            "file_url": file_url,
-            "created_at": datetime.utcnow().isoformat()
-        }).execute()
+        saved = supabase.table("evaluations").insert(evaluation_row(
+            student_name, subject, total_marks, ocr_text, ai, file.filename, file_url, ocr_pages
+        )).execute()
 
         if not getattr(saved, "data", None):
             raise RuntimeError("Failed to save evaluation to database: no data returned from Supabase")
@@ -237,75 +910,180 @@ async def batch_evaluate(
     title: str = Form("Batch Evaluation"),
     total_marks: int = Form(100),
     subject: str = Form("General"),
+    grading_mode: str = Form(GRADING_MODE),
+    wait: bool = Form(False),
 ):
     if len(files) == 0:
         raise HTTPException(status_code=400, detail="No files uploaded")
 
+    grading_mode = check_grading_mode(grading_mode)
+
+    uploads = []
+    for f in files:
+        file_bytes = await f.read()
+        if not file_bytes:
+            continue
+        uploads.append((f.filename, f.content_type or "image/png", file_bytes))
+
     batch = supabase.table("batches").insert({
         "title": title,
         "subject": subject,
         "total_marks": total_marks,
+        "grading_mode": grading_mode,
+        "status": "processing",
+        "heartbeat_at": datetime.utcnow().isoformat(),
         "created_at": datetime.utcnow().isoformat()
     }).execute().data[0]
 
     batch_id = batch["id"]
-    results = []
 
-    for f in files:
-        file_bytes = await f.read()
-        if not file_bytes:
-            continue
+    rows = []
+    if uploads:
+        rows = supabase.table("batch_items").insert([
+            {"batch_id": batch_id, "position": k, "file_name": file_name, "status": "queued"}
+            for k, (file_name, _, _) in enumerate(uploads)
+        ]).execute().data
+        rows.sort(key=lambda r: r["position"])
+
+    items = [
+        {**row, "content_type": content_type, "file_bytes": file_bytes}
+        for row, (_, content_type, file_bytes) in zip(rows, uploads)
+    ]
+
+    # sheets are graded concurrently in the background; a dropped
+    # connection no longer loses the work
+    job = start_batch_job(batch_id, items, subject, total_marks, grading_mode)
+
+    if wait:
+        results, failed = await asyncio.shield(job.task)
+        return {"batch": {**batch, "status": "partial" if failed else "done"}, "items": results, "failed": failed}
+
+    return {"batch": batch, "items": rows, "events_url": f"/answer-sheet/batch/{batch_id}/events"}
+
+
+@router.get("/batch/{batch_id}/events")
+async def batch_events(batch_id: str):
+    """
+    Server-Sent Events of a batch: an "item" event per sheet as it
+    finishes (with its evaluation), then "done". Sheets finished before
+    the client connected are sent first.
+    """
+    job = _batch_jobs.get(batch_id)
+    if job is None:
+        found = await run_io(supabase.table("batches").select("id").eq("id", batch_id).execute)
+        if not found.data:
+            raise HTTPException(status_code=404, detail="Batch not found")
+
+    events = job.follow() if job else poll_batch_events(batch_id)
+
+    async def stream():
+        async for event in events:
+            yield sse_message(event)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-        ocr_text = extract_text_openai_vision(file_bytes)
 
-        raw = evaluate_with_ai(ocr_text, subject, total_marks)
-        ai = safe_json_load(raw) or {
-            "score": 0,
-            "missing_points": [],
-            "strengths": [],
-            "weaknesses": [],
-            "detailed_feedback": raw
-        }
+@router.post("/batch/{batch_id}/resume")
+async def resume_batch(batch_id: str):
+    """
+    Re-runs the items of a batch that failed or never finished (e.g. the
+    worker was restarted), from the files kept in storage. Items whose
+    file never reached storage are marked failed: upload those again.
+    """
+    if batch_id in _batch_jobs:
+        raise HTTPException(status_code=409, detail="Batch is still running")
+
+    # registered before the first await, so a second resume on this worker gets 409
+    job = _batch_jobs[batch_id] = BatchJob(batch_id)
+    try:
+        return await resume_batch_items(job)
+    finally:
+        if job.task is None:
+            job.finished = True
+            _batch_jobs.pop(batch_id, None)
+
+
+async def resume_batch_items(job: BatchJob):
+    """resume_batch's work once its job is registered; starts the job if anything is left to grade."""
+    batch_id = job.batch_id
+
+    found = await run_io(supabase.table("batches").select("*").eq("id", batch_id).execute)
+    if not found.data:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    batch = found.data[0]
+
+    # running on another worker
+    if batch_job_alive(batch):
+        raise HTTPException(status_code=409, detail="Batch is still running")
+
+    rows = (await run_io(
+        supabase.table("batch_items")
+        .select(BATCH_ITEM_FIELDS)
+        .eq("batch_id", batch_id)
+        .neq("status", "done")
+        .order("position")
+        .execute
+    )).data
+
+    if not rows:
+        return {"batch": batch, "items": [], "events_url": f"/answer-sheet/batch/{batch_id}/events"}
+
+    async def fetch(row):
+        if not row.get("file_path"):
+            return None
+        try:
+            return await run_io(supabase.storage.from_(BUCKET).download, row["file_path"])
+        except Exception as e:
+            logger.warning("batch %s: could not download %s: %s", batch_id, row["file_path"], e)
+            return None
+
+    items, lost = [], []
+    for row, file_bytes in zip(rows, await asyncio.gather(*(fetch(r) for r in rows))):
+        if file_bytes:
+            items.append({**row, "content_type": None, "file_bytes": file_bytes})
+        else:
+            lost.append(row)
+
+    if lost:
+        await run_io(
+            supabase.table("batch_items")
+            .update({"status": "failed", "error": "File is not in storage, upload it again"})
+            .in_("id", [r["id"] for r in lost])
+            .execute
+        )
+    if items:
+        await run_io(
+            supabase.table("batch_items")
+            .update({"status": "queued", "error": None})
+            .in_("id", [i["id"] for i in items])
+            .execute
+        )
+
+    batch["status"] = "processing" if items else "partial"
+    batch["heartbeat_at"] = datetime.utcnow().isoformat()
+    await run_io(
+        supabase.table("batches")
+        .update({"status": batch["status"], "heartbeat_at": batch["heartbeat_at"]})
+        .eq("id", batch_id)
+        .execute
+    )
+
+    if items:
+        start_batch_job(
+            batch_id, items, batch["subject"], batch["total_marks"],
+            check_grading_mode(batch.get("grading_mode") or GRADING_MODE), len(lost), job
+        )
 
-        score = int(ai.get("score", 0))
-        score = max(0, min(score, total_marks))
-        percentage = round((score / total_marks) * 100, 2) if total_marks > 0 else 0
-        grade = grade_from_percentage(percentage)
-        status = status_from_percentage(percentage)
-
-        safe_name = re.sub(r"[^a-zA-Z0-9._-]", "_", f.filename or "worksheet.png")
-        final_name = f"{batch_id}_{int(datetime.utcnow().timestamp())}_{safe_name}"
-        file_url = upload_to_supabase_storage(final_name, file_bytes, f.content_type or "image/png")
-
-        saved_eval = supabase.table("evaluations").insert({
-            "student_name": safe_name.replace("_", " ").split(".")[0],
-            "subject": subject,
-            "total_marks": total_marks,
-            "score": score,
-            "percentage": percentage,
-            "grade": grade,
-            "status": status,
-            "confidence": 98.4,
-            "time_saved": "12m",
-            "extracted_answers": ocr_text,
-            "ocr_text": ocr_text,
-            "missing_points": ai.get("missing_points", []),
-            "strengths": ai.get("strengths", []),
-            "weaknesses": ai.get("weaknesses", []),
-            "detailed_feedback": ai.get("detailed_feedback", ""),
-            "file_name": f.filename,
-            "file_url": file_url,
-            "created_at": datetime.utcnow().isoformat()
-        }).execute().data[0]
-
-        supabase.table("batch_items").insert({
-            "batch_id": batch_id,
-            "evaluation_id": saved_eval["id"]
-        }).execute()
-
-        results.append(saved_eval)
-
-    return {"batch": batch, "items": results}
+    return {
+        "batch": batch,
+        "items": [{k: v for k, v in i.items() if k not in ("content_type", "file_bytes")} for i in items],
+        "lost": lost,
+        "events_url": f"/answer-sheet/batch/{batch_id}/events",
+    }
 
 
 # ----------------------------
@@ -372,15 +1150,20 @@ def batch_details(batch_id: str):
     batch = supabase.table("batches").select("*").eq("id", batch_id).single().execute().data
 
     items = supabase.table("batch_items") \
-        .select("evaluation_id, evaluations(*)") \
+        .select(f"{BATCH_ITEM_FIELDS}, evaluations(*)") \
         .eq("batch_id", batch_id) \
+        .order("position") \
         .execute()
 
     out = []
     for x in items.data:
-        out.append(x["evaluations"])
+        if x["evaluations"]:
+            out.append(x["evaluations"])
 
-    return {"batch": batch, "items": out}
+    # per-file state of the batch job (queued / done / failed)
+    states = [{k: v for k, v in x.items() if k != "evaluations"} for x in items.data]
+
+    return {"batch": batch, "items": out, "states": states}
 
 
 # ----------------------------
@@ -415,6 +1198,47 @@ def update_subject(evaluation_id: str, payload: UpdateSubjectRequest):
     return {"ok": True}
 
 
+@router.post("/report/{evaluation_id}/regrade")
+def regrade(evaluation_id: str):
+    """
+    Grades a saved evaluation again (e.g. after its subject or total
+    marks changed) from its stored OCR text; the file is not read again.
+    """
+    res = supabase.table("evaluations") \
+        .select("id,student_name,subject,total_marks,ocr_text,ocr_pages,file_name,file_url") \
+        .eq("id", evaluation_id) \
+        .limit(1) \
+        .execute()
+
+    if not res.data:
+        raise HTTPException(status_code=404, detail="Evaluation not found")
+
+    row = res.data[0]
+    ocr_pages = row.get("ocr_pages") or [row.get("ocr_text") or ""]
+    ocr_text = join_pages(ocr_pages)
+    if not ocr_text:
+        raise HTTPException(status_code=400, detail="Evaluation has no OCR text to grade")
+
+    total_marks = row["total_marks"]
+    raw = cached_grading(ocr_text, row["subject"], total_marks)
+    if raw is None:
+        raw = evaluate_with_ai(ocr_text, row["subject"], total_marks)
+        store_grading(ocr_text, row["subject"], total_marks, "two_step", raw)
+
+    fields = evaluation_row(
+        row["student_name"], row["subject"], total_marks, ocr_text, parse_evaluation(raw),
+        row["file_name"], row["file_url"], ocr_pages
+    )
+    fields.pop("created_at")
+
+    updated = supabase.table("evaluations") \
+        .update(fields) \
+        .eq("id", evaluation_id) \
+        .execute()
+
+    return updated.data[0] if updated.data else {"id": evaluation_id, **fields}
+
+
 @router.put("/report/{evaluation_id}/marks")
 def update_total_marks(evaluation_id: str, payload: UpdateMarksRequest):
     supabase.table("evaluations") \
@@ -10,6 +10,9 @@ import pytesseract
 
 from supabase import create_client, Client
 
+from app.services.storage_upload import upload_path
+from app.services.disk_lifecycle import job_outputs
+
 
 router = APIRouter(tags=["Doubt Solver"])
 
@@ -50,13 +53,7 @@ def extract_text_from_image(image_path: Path) -> str:
 
 
 def upload_to_supabase_storage(local_path: Path, file_name: str) -> str:
-    data = local_path.read_bytes()
-
-    supabase.storage.from_("doubt-images").upload(
-        file_name,
-        data,
-        file_options={"content-type": "image/png"}
-    )
+    upload_path("doubt-images", local_path, file_name, "image/png")
 
     return supabase.storage.from_("doubt-images").get_public_url(file_name)
 
@@ -123,13 +120,15 @@ async def solve_doubt(
             file_id = uuid.uuid4().hex
             img_path = UPLOAD_DIR / f"{file_id}.png"
 
-            content = await image.read()
-            img_path.write_bytes(content)
+            # the local copy is only needed for OCR + upload
+            with job_outputs(img_path):
+                content = await image.read()
+                img_path.write_bytes(content)
 
-            extracted_text = extract_text_from_image(img_path)
+                extracted_text = extract_text_from_image(img_path)
 
-            # upload to supabase storage
-            image_url = upload_to_supabase_storage(img_path, f"{doubt_id}.png")
+                # upload to supabase storage
+                image_url = upload_to_supabase_storage(img_path, f"{doubt_id}.png")
 
             if extracted_text:
                 final_question = (final_question + "\n\n" + extracted_text).strip()
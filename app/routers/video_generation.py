@@ -1,18 +1,38 @@
 import os
 import json
+import bisect
+import itertools
+import math
+import shutil
 import subprocess
+import threading
+import time
 import traceback
+import uuid
+import multiprocessing
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
+from typing import List, Optional
 import textwrap
 
 from dotenv import load_dotenv
+from filelock import FileLock, Timeout
 from fastapi import HTTPException, APIRouter
 from pydantic import BaseModel
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 
 from supabase import create_client, Client
 from groq import Groq
 
+from app.services.media_cache import SingleFlight, cache_key, get_media_cache
+from app.services.storage_upload import upload_path
+from app.services.disk_lifecycle import job_outputs
+from app.services.render_assets import TEACHER_SIZE, load_fonts, scaled_size, teacher_sprites
+from app.services.text_layout import layout_lines, safe_prefix, text_script
+
 # ✅ Edge TTS (FREE)
 import edge_tts
 import asyncio
@@ -45,59 +65,41 @@ supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 # PATHS
 # =========================
 APP_DIR = Path(__file__).resolve().parents[1]  # backend/app
-ASSETS_DIR = APP_DIR / "Assets"  # ✅ MUST be lowercase assets
 OUT_DIR = APP_DIR / "outputs"
 
 AUDIO_DIR = OUT_DIR / "audio"
 FRAMES_DIR = OUT_DIR / "frames"
 VIDEOS_DIR = OUT_DIR / "videos"
+SEGMENTS_DIR = OUT_DIR / "segments"
+HLS_DIR = OUT_DIR / "hls"
 
-for d in [AUDIO_DIR, FRAMES_DIR, VIDEOS_DIR]:
+for d in [AUDIO_DIR, FRAMES_DIR, VIDEOS_DIR, SEGMENTS_DIR, HLS_DIR]:
     d.mkdir(parents=True, exist_ok=True)
 
 # =========================
 # TEXT WRAP HELPER
 # =========================
-def draw_wrapped_text(draw, text, x, y, font, fill, max_width, max_lines=6, line_spacing=8):
-    words = text.split()
-    lines = []
-    current = ""
-
-    for w in words:
-        test = (current + " " + w).strip()
-        wsize = draw.textbbox((0, 0), test, font=font)[2]
-        if wsize <= max_width:
-            current = test
-        else:
-            if current:
-                lines.append(current)
-            current = w
+def wrap_text_lines(draw, text, font, max_width, max_lines=6):
+    # draw is kept for callers; measuring / wrapping is memoized in text_layout
+    return list(layout_lines(text, font, max_width, max_lines))
 
-    if current:
-        lines.append(current)
-
-    lines = lines[:max_lines]  # stop overflow
 
+def draw_text_lines(draw, lines, x, y, font, fill, line_spacing=8):
     for line in lines:
         draw.text((x, y), line, font=font, fill=fill)
         y += font.size + line_spacing
 
     return y
 
+
+def draw_wrapped_text(draw, text, x, y, font, fill, max_width, max_lines=6, line_spacing=8):
+    lines = wrap_text_lines(draw, text, font, max_width, max_lines)
+    return draw_text_lines(draw, lines, x, y, font, fill, line_spacing)
+
 # =========================
 # LOAD TEACHER ASSETS
 # =========================
-def load_teacher_asset(filename: str):
-    p = ASSETS_DIR / filename
-    if not p.exists():
-        raise HTTPException(status_code=500, detail=f"Missing teacher asset: {p}")
-    return Image.open(p).convert("RGBA")
-
-# ✅ correct file names
-TEACHER_IDLE = load_teacher_asset("teacher_idle.png")
-TEACHER_POINT = load_teacher_asset("teacher_point.png")
-TEACHER_HAPPY = load_teacher_asset("teacher_happy.png")
-TEACHER_THINK = load_teacher_asset("teacher_think.png")
+# teacher poses and fonts are loaded on first render (app.services.render_assets)
 
 # =========================
 # REQUEST MODEL
@@ -106,6 +108,7 @@ class VideoRequest(BaseModel):
     topic: str
     grade: int = 5
     language: str = "hinglish"
+    profile: str = "final"  # see RENDER_PROFILES
 
 # =========================
 # 1) LESSON GENERATOR (GROQ)
@@ -177,309 +180,1680 @@ Rules:
     except Exception:
         raise HTTPException(status_code=500, detail=f"Invalid JSON from Groq:\n{text[:800]}")
 
+# =========================
+# 1b) LESSON CACHE
+# =========================
+# bump when the prompt above changes so old lessons are not reused
+LESSON_PROMPT_VERSION = 1
+
+
+def lesson_cache_key(topic: str, grade: int, language: str) -> str:
+    norm_topic = " ".join(topic.split()).casefold()
+    norm_language = language.strip().casefold()
+    return cache_key("lesson", LESSON_PROMPT_VERSION, norm_topic, int(grade), norm_language)
+
+
+# lessons / narration clips being produced right now by some render
+_flights = SingleFlight()
+
+
+def get_or_generate_lesson(topic: str, grade: int, language: str):
+    """
+    Cached lesson, else one Groq call; concurrent renders of the same
+    lesson (e.g. within a batch) share that call.
+    """
+    cache = get_media_cache()
+    key = lesson_cache_key(topic, grade, language)
+
+    while True:
+        lesson = cache.get_json(key)
+        if lesson is not None:
+            return lesson
+        if _flights.lead(key):
+            break
+        _flights.wait(key)
+
+    try:
+        # the previous leader may have finished between get and lead
+        lesson = cache.get_json(key)
+        if lesson is None:
+            lesson = generate_lesson(topic, grade, language)
+            cache.put_json(key, lesson)
+        return lesson
+    finally:
+        _flights.done(key)
+
 # =========================
 # 2) EDGE TTS (FREE)
 # =========================
+TTS_VOICE = "en-IN-NeerjaNeural"
+
+# parallel Edge TTS requests per video
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "4"))
+
+
+# Edge TTS always sends audio-24khz-48kbitrate-mono-mp3 (constant bitrate)
+TTS_MP3_BYTES_PER_SEC = 48000 / 8
+
+
 async def edge_tts_generate(text: str, out_path: Path):
-    voice = "en-IN-NeerjaNeural"
+    """
+    Streams the narration into out_path and returns the spoken words as
+    [(start_s, end_s, word), ...] from Edge TTS WordBoundary events.
+    """
+    communicate = edge_tts.Communicate(text=text, voice=TTS_VOICE, boundary="WordBoundary")
+    words = []
 
-    communicate = edge_tts.Communicate(text=text, voice=voice)
-    await communicate.save(str(out_path))
+    with open(out_path, "wb") as f:
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                f.write(chunk["data"])
+            elif chunk["type"] == "WordBoundary":
+                # offsets are in 100ns ticks
+                start = chunk["offset"] / 1e7
+                words.append((start, start + chunk["duration"] / 1e7, chunk["text"]))
 
-def generate_tts_audio(text: str, out_path: Path):
+    return words
+
+
+def run_async(coro):
     """
     Fix for Render:
     asyncio.run sometimes fails if loop exists.
     """
     try:
-        asyncio.run(edge_tts_generate(text, out_path))
+        return asyncio.run(coro)
     except RuntimeError:
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
-        loop.run_until_complete(edge_tts_generate(text, out_path))
-        loop.close()
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.close()
+
+
+def generate_tts_audio(text: str, out_path: Path):
+    return run_async(edge_tts_generate(text, out_path))
+
+
+async def edge_tts_generate_many(texts, out_paths, limit: int = TTS_CONCURRENCY):
+    sem = asyncio.Semaphore(max(1, limit))
+
+    async def one(text, out_path):
+        async with sem:
+            return await edge_tts_generate(text, out_path)
+
+    return await asyncio.gather(*(one(t, p) for t, p in zip(texts, out_paths)))
+
+
+def tts_cache_key(text: str) -> str:
+    return cache_key("tts", TTS_VOICE, text)
+
+
+def scene_narration(scene, scene_index: int) -> str:
+    # Edge TTS rejects empty text
+    return (scene.get("narration") or scene.get("subtitle") or f"Scene {scene_index + 1}.").strip()
+
+
+def concat_copy_ffmpeg(paths, out_path: Path, extra_args=()):
+    """Joins same-format media files with the concat demuxer (no re-encode)."""
+    list_path = out_path.with_suffix(".ffconcat")
+    lines = ["ffconcat version 1.0"] + [f"file '{p.resolve()}'" for p in paths]
+    list_path.write_text("\n".join(lines) + "\n")
 
-# =========================
-# 3) AUDIO DURATION
-# =========================
-def get_audio_duration_seconds(audio_path: Path) -> float:
     cmd = [
-        "ffprobe",
-        "-v", "error",
-        "-show_entries", "format=duration",
-        "-of", "default=noprint_wrappers=1:nokey=1",
-        str(audio_path)
+        "ffmpeg",
+        "-y",
+        "-f", "concat",
+        "-safe", "0",
+        "-i", str(list_path),
+        "-c", "copy",
+        *extra_args,
+        str(out_path)
     ]
 
-    result = subprocess.run(cmd, capture_output=True, text=True)
+    try:
+        run_ffmpeg(cmd)
+    finally:
+        list_path.unlink(missing_ok=True)
+
 
-    if result.returncode != 0:
-        return 45.0
+def concat_audio_ffmpeg(clip_paths, out_path: Path):
+    concat_copy_ffmpeg(clip_paths, out_path)
 
+
+def generate_scene_audio(video_id: str, lesson: dict, final_audio: Path):
+    """
+    One TTS clip per scene, synthesised concurrently (TTS_CONCURRENCY at a
+    time), then joined into final_audio. Clips already in the media cache
+    (same text + voice) or being made by another render are not
+    synthesised again. Returns
+    (scene_durs, clip_paths, clip_keys, scene_words) so every scene lasts
+    exactly as long as its narration and can follow the spoken words.
+    """
+    clips_dir = AUDIO_DIR / video_id
+    clips_dir.mkdir(parents=True, exist_ok=True)
+
+    texts = [scene_narration(s, i) for i, s in enumerate(lesson["scenes"])]
+    clip_paths = [clips_dir / f"scene_{i:02d}.mp3" for i in range(len(texts))]
+
+    cache = get_media_cache()
+    keys = [tts_cache_key(t) for t in texts]
+    timings = [None] * len(texts)
+
+    def from_cache(i):
+        timings[i] = cache.get_json(keys[i])
+        return timings[i] is not None and cache.get_file(keys[i], ".mp3", clip_paths[i])
+
+    def synthesise(idx):
+        if not idx:
+            return
+        words = run_async(edge_tts_generate_many(
+            [texts[i] for i in idx],
+            [clip_paths[i] for i in idx]
+        ))
+        for i, w in zip(idx, words):
+            timings[i] = {"duration": mp3_duration_seconds(clip_paths[i], w), "words": w}
+            cache.put_file(keys[i], ".mp3", clip_paths[i])
+            cache.put_json(keys[i], timings[i])
+
+    missing = [i for i in range(len(texts)) if not from_cache(i)]
+
+    # one request per distinct text: repeats in this lesson and texts
+    # another render is synthesising right now are read from the cache
+    mine = {i for i in missing if _flights.lead(keys[i])}
     try:
-        return float(result.stdout.strip())
-    except:
-        return 45.0
+        synthesise(sorted(mine))
+    finally:
+        for i in mine:
+            _flights.done(keys[i])
+
+    waiting = [i for i in missing if i not in mine]
+    for i in waiting:
+        _flights.wait(keys[i])
+
+    # the other render failed -> do it ourselves
+    synthesise([i for i in waiting if not from_cache(i)])
+
+    scene_durs = [t["duration"] for t in timings]
+    scene_words = [[tuple(w) for w in t["words"]] for t in timings]
+    concat_audio_ffmpeg(clip_paths, final_audio)
+
+    return scene_durs, clip_paths, keys, scene_words
 
 # =========================
-# 4) FRAME RENDER
+# 3) AUDIO DURATION
 # =========================
-def render_scene_frame(scene, frame_path: Path, t: float, scene_duration: float, scene_index: int):
-    W, H = 1280, 720
-    bg = Image.new("RGBA", (W, H), (18, 18, 28, 255))
+def mp3_duration_seconds(audio_path: Path, words=()) -> float:
+    """
+    Length of an Edge TTS clip from its size (the stream is CBR), never
+    shorter than the last spoken word.
+    """
+    dur = audio_path.stat().st_size / TTS_MP3_BYTES_PER_SEC
+    if words:
+        dur = max(dur, words[-1][1])
+    return dur
+
+# =========================
+# 4) FRAME RENDER (LAYERED)
+# =========================
+# layout in 1280x720 pixels; smaller profiles draw everything times
+# width / FRAME_W (see px) instead of scaling finished frames down
+FRAME_W, FRAME_H = 1280, 720
+
+BOARD_X, BOARD_Y = 430, 60
+BOARD_W, BOARD_H = 820, 610
+
+BUBBLE_X, BUBBLE_Y = 40, 40
+BUBBLE_W, BUBBLE_H = 370, 140
+
+# left column region the typed bubble text can touch (redrawn per frame)
+BUBBLE_TEXT_BOX = (0, 0, BOARD_X, 300)
+
+TEACHER_POS = (30, 140)
+
+
+def px(value, scale: float = 1.0) -> int:
+    """A 1280x720 layout length at scale (never below 1 px)."""
+    return max(1, round(value * scale))
+
+
+def px_box(box, scale: float = 1.0):
+    return tuple(round(v * scale) for v in box)
+
+
+def pick_teacher(scene_index: int, lite: bool = False, scale: float = 1.0):
+    """Pose sprite, already scaled to TEACHER_SIZE * scale (idle, point, think, happy)."""
+    return teacher_sprites(scaled_size(TEACHER_SIZE, scale), lite)[scene_index % 4]
+
+
+def build_scene_plate(scene, scene_index: int, fonts, lite: bool = False, size=(FRAME_W, FRAME_H)):
+    """
+    Static layer of a scene (background, glows, teacher, board,
+    subtitle, empty narration bubble). Built once per scene, directly at
+    size; fonts must be loaded at the same scale (width / FRAME_W).
+    lite drops the glows and uses the cheaper-filtered teacher sprites.
+    """
+    font_big, _, _ = fonts
+    scale = size[0] / FRAME_W
+
+    bg = Image.new("RGBA", tuple(size), (18, 18, 28, 255))
     draw = ImageDraw.Draw(bg)
 
     # glow
-    draw.ellipse((-250, -200, 550, 400), fill=(120, 80, 255, 55))
-    draw.ellipse((850, 450, 1600, 1000), fill=(50, 255, 140, 45))
+    if not lite:
+        draw.ellipse(px_box((-250, -200, 550, 400), scale), fill=(120, 80, 255, 55))
+        draw.ellipse(px_box((850, 450, 1600, 1000), scale), fill=(50, 255, 140, 45))
 
     # teacher pose
-    if scene_index % 4 == 0:
-        teacher = TEACHER_IDLE
-    elif scene_index % 4 == 1:
-        teacher = TEACHER_POINT
-    elif scene_index % 4 == 2:
-        teacher = TEACHER_THINK
-    else:
-        teacher = TEACHER_HAPPY
-
-    teacher = teacher.resize((380, 560))
-    bg.alpha_composite(teacher, (30, 140))
+    bg.alpha_composite(pick_teacher(scene_index, lite, scale), px_box(TEACHER_POS, scale))
 
     # board
-    board_x, board_y = 430, 60
-    board_w, board_h = 820, 610
-
     draw.rounded_rectangle(
-        (board_x, board_y, board_x + board_w, board_y + board_h),
-        radius=34,
+        px_box((BOARD_X, BOARD_Y, BOARD_X + BOARD_W, BOARD_Y + BOARD_H), scale),
+        radius=px(34, scale),
         fill=(10, 10, 18, 215),
         outline=(255, 255, 255, 70),
-        width=2
+        width=px(2, scale)
     )
 
-    # fonts (bigger)
-    try:
-        font_big = ImageFont.truetype("arial.ttf", 58)
-        font_small = ImageFont.truetype("arial.ttf", 40)
-        font_tiny = ImageFont.truetype("arial.ttf", 34)
-    except:
-        font_big = ImageFont.load_default()
-        font_small = ImageFont.load_default()
-        font_tiny = ImageFont.load_default()
-
-    subtitle = scene.get("subtitle", "")
-
     # subtitle wrap
     draw_wrapped_text(
         draw,
-        subtitle,
-        board_x + 30,
-        board_y + 25,
+        scene.get("subtitle", ""),
+        px(BOARD_X + 30, scale),
+        px(BOARD_Y + 25, scale),
         font_big,
         (255, 255, 255, 240),
-        max_width=board_w - 60,
-        max_lines=2
+        max_width=px(BOARD_W - 60, scale),
+        max_lines=2,
+        line_spacing=px(8, scale)
     )
 
-    ex = scene.get("example", {})
-    q = ex.get("question", "")
-    steps = ex.get("steps", [])
+    # narration bubble (text is typed in per frame)
+    draw.rounded_rectangle(
+        px_box((BUBBLE_X, BUBBLE_Y, BUBBLE_X + BUBBLE_W, BUBBLE_Y + BUBBLE_H), scale),
+        radius=px(22, scale),
+        fill=(0, 0, 0, 160),
+        outline=(255, 255, 255, 45),
+        width=px(2, scale)
+    )
 
-    # step reveal
-    reveal_speed = 1.0
-    lines_to_show = int(t / reveal_speed)
-    lines_to_show = max(0, min(lines_to_show, len(steps)))
+    return bg
 
-    y = board_y + 150
 
-    if t > 0.4 and q:
-        y = draw_wrapped_text(
-            draw,
-            f"Q: {q}",
-            board_x + 30,
-            y,
-            font_small,
-            (255, 255, 255, 230),
-            max_width=board_w - 60,
-            max_lines=2
+def word_char_marks(text: str, words):
+    """
+    Lines the spoken words up with text: [(start_s, chars_spoken), ...].
+    Words the TTS spoke differently from how they are written (numbers,
+    symbols) are skipped.
+    """
+    marks, pos = [], 0
+
+    for start, _, word in words:
+        # look a little ahead only, so a skipped word can't jump the cursor
+        at = text.find(word, pos, pos + len(word) + 40)
+        if at < 0:
+            continue
+        pos = at + len(word)
+        marks.append((start, pos))
+
+    return marks
+
+
+def step_reveal_times(n_steps: int, words):
+    """
+    Start time of each step: spread evenly over the spoken words, or one
+    step per second without word timings.
+    """
+    if not words:
+        return [float(i + 1) for i in range(n_steps)]
+
+    n = len(words)
+    return [words[(i + 1) * n // (n_steps + 1)][0] for i in range(n_steps)]
+
+
+class SceneRenderer:
+    """
+    Renders frames of one scene. The static plate is built once in
+    __init__, the board (question + revealed steps) once per reveal state;
+    render() only types the bubble text into the bubble corner.
+    iter_states() lets callers skip frames that would look the same.
+    With words (Edge TTS word timings) the bubble and the steps follow
+    the speech instead of a fixed pace. Plate, sprites, fonts and text
+    are laid out directly at size (the 1280x720 layout times
+    width / FRAME_W), so smaller profiles draw fewer pixels.
+    """
+
+    def __init__(self, scene, scene_index: int, scene_duration: float, fonts=None, words=None,
+                 size=(FRAME_W, FRAME_H), lite: bool = False):
+        self.scene_duration = scene_duration
+
+        ex = scene.get("example", {})
+        self.question = ex.get("question", "")
+        self.steps = ex.get("steps", [])
+        self.bubble = scene.get("narration", "")
+
+        # Hindi scenes need a font with Devanagari glyphs
+        script = text_script(" ".join([scene.get("subtitle", ""), self.bubble, self.question, *self.steps]))
+        self.size = tuple(size)
+        self.scale = self.size[0] / FRAME_W
+        self.fonts = fonts or load_fonts(script, self.scale)
+
+        words = words or ()
+        self._step_times = step_reveal_times(len(self.steps), words)
+        marks = word_char_marks(self.bubble, words)
+        self._word_starts = [m[0] for m in marks]
+        self._word_chars = [m[1] for m in marks]
+
+        self.plate = build_scene_plate(scene, scene_index, self.fonts, lite, self.size)
+        self._bubble_box = px_box(BUBBLE_TEXT_BOX, self.scale)
+        self._board_cache = {}
+
+    def board_layer(self, show_question: bool, lines_to_show: int):
+        """
+        Plate + question + revealed steps as (rgba, rgb); cached per
+        reveal state.
+        """
+        key = (show_question, lines_to_show)
+        if key in self._board_cache:
+            return self._board_cache[key]
+
+        _, font_small, font_tiny = self.fonts
+        scale = self.scale
+
+        layer = self.plate.copy()
+        draw = ImageDraw.Draw(layer)
+
+        y = px(BOARD_Y + 150, scale)
+
+        if show_question:
+            y = draw_wrapped_text(
+                draw,
+                f"Q: {self.question}",
+                px(BOARD_X + 30, scale),
+                y,
+                font_small,
+                (255, 255, 255, 230),
+                max_width=px(BOARD_W - 60, scale),
+                max_lines=2,
+                line_spacing=px(8, scale)
+            )
+            y += px(10, scale)
+
+        for i in range(lines_to_show):
+            y = draw_wrapped_text(
+                draw,
+                f"{i+1}. {self.steps[i]}",
+                px(BOARD_X + 40, scale),
+                y,
+                font_tiny,
+                (190, 230, 255, 240),
+                max_width=px(BOARD_W - 70, scale),
+                max_lines=1,
+                line_spacing=px(8, scale)
+            )
+            y += px(6, scale)
+
+        self._board_cache[key] = (layer, layer.convert("RGB"))
+        return self._board_cache[key]
+
+    def frame_state(self, t: float):
+        """
+        Everything that differs between frames of this scene at time t.
+        Two frames with equal states are pixel-identical.
+        """
+        _, _, font_tiny = self.fonts
+
+        # step reveal
+        lines_to_show = bisect.bisect_right(self._step_times, t)
+        show_question = bool(t > 0.4 and self.question)
+
+        # narration bubble typing: a word appears as it is spoken
+        if self._word_starts:
+            k = bisect.bisect_right(self._word_starts, t)
+            chars_to_show = self._word_chars[k - 1] if k else 0
+        else:
+            chars_to_show = int((t / self.scene_duration) * len(self.bubble))
+        bubble_lines = layout_lines(
+            safe_prefix(self.bubble, chars_to_show),
+            font_tiny,
+            px(BUBBLE_W - 30, self.scale),
+            3
         )
-        y += 10
 
-    for i in range(lines_to_show):
-        st = steps[i]
-        y = draw_wrapped_text(
+        return show_question, lines_to_show, bubble_lines
+
+    def render_state(self, state):
+        _, _, font_tiny = self.fonts
+        show_question, lines_to_show, bubble_lines = state
+
+        layer, layer_rgb = self.board_layer(show_question, lines_to_show)
+
+        # only the bubble corner changes between frames of a reveal state
+        box_x, box_y = self._bubble_box[:2]
+        corner = layer.crop(self._bubble_box)
+        draw = ImageDraw.Draw(corner)
+
+        draw_text_lines(
             draw,
-            f"{i+1}. {st}",
-            board_x + 40,
-            y,
+            bubble_lines,
+            px(BUBBLE_X + 16, self.scale) - box_x,
+            px(BUBBLE_Y + 16, self.scale) - box_y,
             font_tiny,
-            (190, 230, 255, 240),
-            max_width=board_w - 70,
-            max_lines=1
+            (255, 255, 255, 240),
+            line_spacing=px(8, self.scale)
         )
-        y += 6
 
-    # narration bubble
-    bubble = scene.get("narration", "")
-    bx, by = 40, 40
-    bw, bh = 370, 140
+        frame = layer_rgb.copy()
+        frame.paste(corner.convert("RGB"), (box_x, box_y))
+        return frame
 
-    draw.rounded_rectangle(
-        (bx, by, bx + bw, by + bh),
-        radius=22,
-        fill=(0, 0, 0, 160),
-        outline=(255, 255, 255, 45),
-        width=2
-    )
+    def render(self, t: float):
+        return self.render_state(self.frame_state(t))
 
-    chars_to_show = int((t / scene_duration) * len(bubble))
-    bubble_text = bubble[:chars_to_show]
+    def iter_states(self, frames_per_scene: int, fps: int):
+        """
+        Yields (state, hold_frames) for each run of identical frames, so
+        callers render once per visual change instead of once per frame.
+        """
+        prev, hold = None, 0
 
-    draw_wrapped_text(
-        draw,
-        bubble_text,
-        bx + 16,
-        by + 16,
-        font_tiny,
-        (255, 255, 255, 240),
-        max_width=bw - 30,
-        max_lines=3
-    )
+        for f in range(frames_per_scene):
+            state = self.frame_state(f / fps)
+            if state == prev:
+                hold += 1
+                continue
+
+            if prev is not None:
+                yield prev, hold
+            prev, hold = state, 1
+
+        if prev is not None:
+            yield prev, hold
 
-    bg.convert("RGB").save(frame_path, "PNG")
+
+def render_scene_frame(scene, frame_path: Path, t: float, scene_duration: float, scene_index: int):
+    """One-off frame render (rebuilds the plate). Use SceneRenderer for loops."""
+    SceneRenderer(scene, scene_index, scene_duration).render(t).save(frame_path, "PNG")
 
 # =========================
-# 5) CREATE FRAMES (FAST)
+# 5) SCENE TIMING
 # =========================
-def create_frames_for_video(video_id: str, lesson: dict, final_audio_path: Path):
-    frames_folder = FRAMES_DIR / video_id
-    frames_folder.mkdir(parents=True, exist_ok=True)
+VIDEO_FPS = 6  # ✅ FAST
 
-    fps = 6  # ✅ FAST
-    frame_num = 1
 
-    total_dur = get_audio_duration_seconds(final_audio_path)
-    scenes_count = len(lesson["scenes"])
+def scene_frame_count(scene_dur: float, fps: int) -> int:
+    """Rounded up, so a scene's segment never cuts its narration short."""
+    return max(1, math.ceil(scene_dur * fps - 1e-6))
 
-    # keep scene short
-    scene_dur = max(4.0, total_dur / scenes_count)
 
-    for scene_index, scene in enumerate(lesson["scenes"]):
-        frames_per_scene = int(scene_dur * fps)
+# =========================
+# 5a) RENDER PROFILES
+# =========================
+# draft / preview are for checking the content: smaller frames, fewer
+# of them, a faster x264 preset and lite plates (no glows).
+# final is the full-quality 1280x720 output.
+RENDER_PROFILES = {
+    "draft": {"width": 640, "height": 360, "fps": 3, "preset": "ultrafast", "crf": 32, "lite": True},
+    "preview": {"width": 854, "height": 480, "fps": 4, "preset": "veryfast", "crf": 28, "lite": True},
+    "final": {"width": FRAME_W, "height": FRAME_H, "fps": VIDEO_FPS, "preset": "medium", "crf": 23, "lite": False},
+}
+FINAL_PROFILE = "final"
+
+# (scale, lite) of the sprites and fonts each profile draws with; warmed at startup
+RENDER_ASSET_VARIANTS = tuple(sorted({(p["width"] / FRAME_W, p["lite"]) for p in RENDER_PROFILES.values()}))
 
-        for f in range(frames_per_scene):
-            t = f / fps
-            frame_path = frames_folder / f"frame_{frame_num:05d}.png"
-            render_scene_frame(scene, frame_path, t, scene_dur, scene_index)
-            frame_num += 1
 
-    return frames_folder, fps
+def render_upload_name(video_id: str, profile: str, revision: str = None) -> str:
+    """Storage name (no extension); only final renders get the bare id."""
+    name = video_id if profile == FINAL_PROFILE else f"{video_id}_{profile}"
+    return f"{name}_{revision}" if revision else name
+
 
 # =========================
-# 6) FFMPEG MP4
+# 5b) PARALLEL SCENE RENDER (PROCESS POOL)
 # =========================
-def render_video_ffmpeg(frames_folder: Path, fps: int, audio_path: Path, out_mp4: Path):
-    cmd = [
-        "ffmpeg",
-        "-y",
-        "-r", str(fps),
-        "-i", str(frames_folder / "frame_%05d.png"),
-        "-i", str(audio_path),
-        "-c:v", "libx264",
-        "-pix_fmt", "yuv420p",
-        "-shortest",
-        str(out_mp4)
-    ]
+# PIL work is GIL-bound, so scenes are spread over processes.
+# 1 = render in the request thread (serial path). The pool belongs to one
+# uvicorn worker: with --workers N, set this to about cpu count / N.
+VIDEO_RENDER_WORKERS = int(os.getenv("VIDEO_RENDER_WORKERS", str(os.cpu_count() or 1)))
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    """Shared pool, so concurrent renders together stay within VIDEO_RENDER_WORKERS."""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            # spawn: forking a threaded uvicorn worker can deadlock the child
+            _render_pool = ProcessPoolExecutor(
+                max_workers=VIDEO_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _render_pool
+
+
+def drop_render_pool(pool):
+    """
+    Forgets a pool whose worker died (OOM kill, segfault): it stays
+    broken for good, so the next get_render_pool() starts a new one.
+    """
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is pool:
+            _render_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def map_scenes(fn, tasks, workers: int):
+    """
+    Runs fn(*task) for every task and yields results in task order.
+    At most 2 x workers tasks are in flight so finished scenes don't pile
+    up in memory while an earlier one is still rendering.
+    """
+    if workers <= 1:
+        for args in tasks:
+            yield fn(*args)
+        return
+
+    pool = get_render_pool()
+    pending = deque()
+
+    try:
+        for args in tasks:
+            pending.append(pool.submit(fn, *args))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+    except BrokenProcessPool:
+        # this render fails; later ones get a fresh pool
+        drop_render_pool(pool)
+        raise
+    finally:
+        for fut in pending:
+            fut.cancel()
 
-    result = subprocess.run(cmd, capture_output=True, text=True)
 
-    if result.returncode != 0:
+# =========================
+# 6) SCENE SEGMENTS (FFMPEG)
+# =========================
+# Every scene is encoded with its narration clip as its own MP4 segment;
+# the final video is a stream copy of the segments. Only edited scenes
+# need encoding again.
+#
+# How frames reach a scene's ffmpeg:
+# "stream" pipes raw RGB frames (no per-frame files),
+# "vfr" writes one PNG per visual change + an ffconcat list with durations,
+# "png" writes every frame as a PNG first (old behaviour)
+# Frames are drawn once per visual change in every mode, but only vfr
+# also encodes once per change; stream and png encode duration x fps
+# frames. vfr still came out slower offline (PNG write + decode cost more
+# than x264 saves on held frames: 35.6 vs 58.9 frames/s draft, 24.1 vs
+# 28.9 final), so stream stays the default.
+VIDEO_RENDER_MODE = os.getenv("VIDEO_RENDER_MODE", "stream").strip().lower()
+
+# a keyframe at least this often, so HLS can cut scenes into short pieces
+# (and players can seek without decoding a whole scene)
+VIDEO_KEYFRAME_SECONDS = 4
+
+# bump when frames / encoding change so cached segments and videos are not reused
+VIDEO_RENDER_VERSION = 8
+
+
+def keyframe_runs(start: int, hold: int, fps: int):
+    """
+    Splits a run of hold identical frames starting at frame start at
+    every VIDEO_KEYFRAME_SECONDS mark, so in vfr mode a frame begins on
+    each mark and -force_key_frames has a frame to turn into a keyframe.
+    """
+    grid = round(VIDEO_KEYFRAME_SECONDS * fps)
+    end = start + hold
+    runs = []
+
+    while start < end:
+        next_mark = (start // grid + 1) * grid
+        runs.append((start, min(end, next_mark)))
+        start = next_mark
+
+    return runs
+
+
+def run_ffmpeg(cmd, stdin_chunks=None):
+    """
+    Runs ffmpeg, writing stdin_chunks (bytes) to its stdin when given.
+    stderr is drained on a thread so ffmpeg never blocks on a full pipe
+    while we write frames. Raises HTTPException with stderr on failure.
+    """
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE if stdin_chunks is not None else subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+
+    stderr_chunks = []
+    drain = threading.Thread(target=lambda: stderr_chunks.append(proc.stderr.read()), daemon=True)
+    drain.start()
+
+    if stdin_chunks is not None:
+        try:
+            for chunk in stdin_chunks:
+                proc.stdin.write(chunk)
+            proc.stdin.close()
+        except BrokenPipeError:
+            # ffmpeg exited early, its stderr says why
+            pass
+        except Exception:
+            proc.kill()
+            proc.wait()
+            raise
+
+    proc.wait()
+    drain.join()
+
+    if proc.returncode != 0:
+        stderr = b"".join(stderr_chunks).decode("utf-8", errors="replace")
         raise HTTPException(
             status_code=500,
-            detail=f"FFmpeg failed:\n{result.stdout}\n{result.stderr}"
+            detail=f"FFmpeg failed:\n{stderr}"
         )
 
+
+def segment_output_args(clip_path: Path, seg_dur: float, out_path: Path, profile: dict, extra_args=()):
+    # narration is padded with silence up to the segment's exact length
+    return [
+        "-i", str(clip_path),
+        "-af", "apad",
+        "-t", f"{seg_dur:.6f}",
+        "-c:v", "libx264",
+        "-preset", profile["preset"],
+        "-crf", str(profile["crf"]),
+        "-force_key_frames", f"expr:gte(t,n_forced*{VIDEO_KEYFRAME_SECONDS})",
+        "-pix_fmt", "yuv420p",
+        "-c:a", "aac",
+        *extra_args,
+        str(out_path)
+    ]
+
+
+def segment_thumb_path(seg_path: Path) -> Path:
+    return seg_path.with_suffix(".thumb.jpg")
+
+
+def save_scene_thumb(frame, thumb_path: Path):
+    """THUMB_SIZE JPEG of a rendered frame (poster / preview source)."""
+    if frame.size != THUMB_SIZE:
+        frame = frame.resize(THUMB_SIZE, Image.BILINEAR)
+    frame.save(thumb_path, "JPEG", quality=82, optimize=True)
+
+
+def build_scene_segment(scene, scene_index: int, scene_dur: float, frames_per_scene: int, profile: dict,
+                        clip_path: Path, out_path: Path, words=None, mode: str = VIDEO_RENDER_MODE) -> Path:
+    """
+    Pool task: renders one scene with a RENDER_PROFILES entry and encodes
+    it together with its narration clip into out_path. Frames are
+    rendered once per visual change (SceneRenderer.iter_states). The last
+    frame (everything revealed) is saved as the scene's thumbnail, see
+    segment_thumb_path.
+    """
+    fps = profile["fps"]
+    renderer = SceneRenderer(
+        scene, scene_index, scene_dur, words=words,
+        size=(profile["width"], profile["height"]), lite=profile["lite"]
+    )
+    seg_dur = frames_per_scene / fps
+    last_frame = None
+
+    def frames():
+        nonlocal last_frame
+        for state, hold in renderer.iter_states(frames_per_scene, fps):
+            last_frame = renderer.render_state(state)
+            yield last_frame, hold
+
+    if mode not in ("png", "vfr"):
+        cmd = [
+            "ffmpeg",
+            "-y",
+            "-loglevel", "error",
+            "-f", "rawvideo",
+            "-pix_fmt", "rgb24",
+            "-s", f"{profile['width']}x{profile['height']}",
+            "-r", str(fps),
+            "-i", "-",
+        ] + segment_output_args(clip_path, seg_dur, out_path, profile)
+
+        def raw_frames():
+            # one buffer per visual change, written hold times
+            for frame, hold in frames():
+                yield from itertools.repeat(frame.tobytes(), hold)
+
+        run_ffmpeg(cmd, raw_frames())
+        save_scene_thumb(last_frame, segment_thumb_path(out_path))
+        return out_path
+
+    frames_folder = FRAMES_DIR / out_path.parent.name / out_path.stem
+    frames_folder.mkdir(parents=True, exist_ok=True)
+
+    try:
+        if mode == "vfr":
+            lines = ["ffconcat version 1.0"]
+            name = None
+            start = 0
+
+            for k, (frame, hold) in enumerate(frames()):
+                name = f"frame_{k:05d}.png"
+                # written once and read once by ffmpeg, so favour speed over size
+                frame.save(frames_folder / name, "PNG", compress_level=1)
+
+                for run_start, run_end in keyframe_runs(start, hold, fps):
+                    # from rounded start times, so the durations add up to exactly each mark
+                    duration = round(run_end / fps, 6) - round(run_start / fps, 6)
+                    lines.append(f"file '{name}'")
+                    lines.append(f"duration {duration:.6f}")
+                start += hold
+
+            # concat demuxer ignores the last duration unless the file is repeated
+            lines.append(f"file '{name}'")
+
+            concat_path = frames_folder / "frames.ffconcat"
+            concat_path.write_text("\n".join(lines) + "\n")
+
+            cmd = [
+                "ffmpeg",
+                "-y",
+                "-f", "concat",
+                "-safe", "0",
+                "-i", str(concat_path),
+            ] + segment_output_args(clip_path, seg_dur, out_path, profile, ["-fps_mode", "vfr"])
+
+        else:
+            frame_num = 1
+            for frame, hold in frames():
+                first_path = frames_folder / f"frame_{frame_num:05d}.png"
+                frame.save(first_path, "PNG")
+
+                # held frames are the same picture, no need to compress it again
+                for k in range(1, hold):
+                    shutil.copyfile(first_path, frames_folder / f"frame_{frame_num + k:05d}.png")
+                frame_num += hold
+
+            cmd = [
+                "ffmpeg",
+                "-y",
+                "-r", str(fps),
+                "-i", str(frames_folder / "frame_%05d.png"),
+            ] + segment_output_args(clip_path, seg_dur, out_path, profile)
+
+        run_ffmpeg(cmd)
+
+    finally:
+        shutil.rmtree(frames_folder, ignore_errors=True)
+
+    save_scene_thumb(last_frame, segment_thumb_path(out_path))
+    return out_path
+
+
+def scene_segment_key(scene, scene_index: int, clip_key: str, frames_per_scene: int, profile: dict) -> str:
+    return cache_key(
+        "segment", VIDEO_RENDER_VERSION, VIDEO_RENDER_MODE, profile,
+        scene_index % 4,  # teacher pose
+        scene, clip_key, frames_per_scene
+    )
+
+
+def build_video_segments(video_id: str, lesson: dict, scene_durs, clip_paths, clip_keys, scene_words,
+                         profile: str = FINAL_PROFILE, workers: int = VIDEO_RENDER_WORKERS,
+                         on_frames=None, on_segment=None):
+    """
+    One MP4 segment (+ thumbnail) per scene under SEGMENTS_DIR/<video_id>,
+    in scene order. Segments already in the media cache are copied; the
+    rest are built on the render pool and then cached. on_segment(path, seconds)
+    is called for every segment in scene order as soon as it and all
+    earlier ones are ready.
+    """
+    seg_dir = SEGMENTS_DIR / video_id
+    seg_dir.mkdir(parents=True, exist_ok=True)
+
+    cache = get_media_cache()
+    settings = RENDER_PROFILES[profile]
+
+    frames = [scene_frame_count(d, settings["fps"]) for d in scene_durs]
+    seg_paths = [seg_dir / f"scene_{i:02d}.mp4" for i in range(len(frames))]
+    keys = [
+        scene_segment_key(scene, i, clip_keys[i], frames[i], settings)
+        for i, scene in enumerate(lesson["scenes"])
+    ]
+
+    total_frames = sum(frames)
+    done_frames = 0
+    todo = []
+
+    for i in range(len(seg_paths)):
+        if cache.get_file(keys[i], ".mp4", seg_paths[i]) and \
+                cache.get_file(keys[i], ".thumb.jpg", segment_thumb_path(seg_paths[i])):
+            done_frames += frames[i]
+        else:
+            todo.append(i)
+
+    tasks = [
+        (lesson["scenes"][i], i, scene_durs[i], frames[i], settings, clip_paths[i], seg_paths[i], scene_words[i])
+        for i in todo
+    ]
+
+    built = map_scenes(build_scene_segment, tasks, workers)
+    todo = set(todo)
+
+    for i in range(len(seg_paths)):
+        if i in todo:
+            next(built)
+            cache.put_file(keys[i], ".mp4", seg_paths[i])
+            cache.put_file(keys[i], ".thumb.jpg", segment_thumb_path(seg_paths[i]))
+            done_frames += frames[i]
+            if on_frames:
+                on_frames(done_frames, total_frames)
+
+        if on_segment:
+            on_segment(seg_paths[i], frames[i] / settings["fps"])
+
+    return seg_paths
+
+
+def concat_segments(segment_paths, out_mp4: Path):
+    concat_copy_ffmpeg(segment_paths, out_mp4, ["-movflags", "+faststart"])
+
 # =========================
-# 7) UPLOAD TO SUPABASE STORAGE
+# 6b) POSTER + ANIMATED PREVIEW
 # =========================
-def upload_file(bucket: str, file_path: Path, dest_path: str, content_type: str):
-    data = file_path.read_bytes()
+# Made from the scene thumbnails the segment render already saved (no
+# second decode of the video), so listing pages load a few KB instead
+# of the MP4.
+THUMB_SIZE = (640, 360)
+POSTER_SCENE = 0
+PREVIEW_SIZE = (320, 180)
+PREVIEW_FRAME_MS = 800
+
+
+def build_previews(video_id: str, segment_paths):
+    """
+    Poster JPEG (POSTER_SCENE's thumbnail) and an animated WebP with one
+    PREVIEW_SIZE frame per scene. Returns (poster_path, preview_path).
+    """
+    thumbs = [segment_thumb_path(p) for p in segment_paths]
+
+    poster_path = VIDEOS_DIR / f"{video_id}.jpg"
+    preview_path = VIDEOS_DIR / f"{video_id}.preview.webp"
+    poster_path.parent.mkdir(parents=True, exist_ok=True)
+
+    shutil.copyfile(thumbs[min(POSTER_SCENE, len(thumbs) - 1)], poster_path)
 
-    supabase.storage.from_(bucket).upload(
-        dest_path,
-        data,
-        file_options={"content-type": content_type}
+    frames = []
+    for t in thumbs:
+        with Image.open(t) as im:
+            frames.append(im.convert("RGB").resize(PREVIEW_SIZE, Image.BILINEAR))
+
+    frames[0].save(
+        preview_path, "WEBP",
+        save_all=True, append_images=frames[1:],
+        duration=PREVIEW_FRAME_MS, loop=0, quality=60, method=4
     )
 
+    return poster_path, preview_path
+
+
+def upload_previews(name: str, previews) -> dict:
+    poster_path, preview_path = previews
+    return {
+        "poster_url": upload_file("videos", poster_path, f"{name}.jpg", "image/jpeg"),
+        "preview_url": upload_file("videos", preview_path, f"{name}.preview.webp", "image/webp"),
+    }
+
+# =========================
+# 7) UPLOAD TO SUPABASE STORAGE
+# =========================
+def upload_file(bucket: str, file_path: Path, dest_path: str, content_type: str,
+                upsert: bool = True, cache_control: str = None):
+    # streamed in fixed-size chunks, so big MP4s never sit in memory.
+    # Object names are fixed per video / lesson revision, so a retried
+    # render overwrites whatever a failed attempt already uploaded.
+    upload_path(bucket, file_path, dest_path, content_type, upsert=upsert, cache_control=cache_control)
+
     return supabase.storage.from_(bucket).get_public_url(dest_path)
 
+# =========================
+# 7b) HLS (PROGRESSIVE UPLOAD)
+# =========================
+# Scene segments are cut into short MPEG-TS pieces as they come off the
+# render pool; every piece is uploaded right away and the EVENT playlist
+# re-uploaded, so students can start watching while later scenes render.
+VIDEO_HLS = os.getenv("VIDEO_HLS", "1") == "1"
+HLS_SEGMENT_SECONDS = VIDEO_KEYFRAME_SECONDS
+# cut points sit this far ahead of each forced keyframe: the segment muxer
+# cuts at the first keyframe at or after a cut point, so a keyframe a few
+# ms off the grid (timestamp rounding) must not be skipped. In vfr mode
+# keyframe_runs makes sure a frame starts on every grid point.
+HLS_CUT_LEAD_SECONDS = 0.5
+
+
+def hls_cut_times(seconds: float):
+    """Cut points of a scene lasting `seconds`, one before every forced keyframe."""
+    cuts = []
+    t = HLS_SEGMENT_SECONDS
+    while t < seconds:
+        cuts.append(f"{t - HLS_CUT_LEAD_SECONDS:.3f}")
+        t += HLS_SEGMENT_SECONDS
+    return cuts
+
+
+class HlsPublisher:
+    """
+    Builds videos/hls/<name>/index.m3u8 scene by scene. hls_url is set
+    on the videos row once the first piece is playable.
+    """
+
+    def __init__(self, video_id: str, name: str):
+        self.video_id = video_id
+        self.prefix = f"hls/{name}"
+        self.dir = HLS_DIR / video_id
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir.mkdir(parents=True)
+
+        self.entries = []  # (file name, seconds, first piece of a scene)
+        self.url = None
+
+    def add_segment(self, seg_path: Path, seconds: float):
+        list_path = self.dir / "pieces.csv"
+
+        # stream copy; pieces are cut on the forced keyframes. Every scene
+        # keeps its own timestamps (EXT-X-DISCONTINUITY between scenes).
+        cuts = hls_cut_times(seconds)
+        cmd = [
+            "ffmpeg",
+            "-y",
+            "-loglevel", "error",
+            "-i", str(seg_path),
+            "-c", "copy",
+            # keep the scene's own timestamps, so the list's start times
+            # are not shifted by the B-frame / AAC priming delay
+            "-avoid_negative_ts", "disabled",
+            "-f", "segment",
+            *(["-segment_times", ",".join(cuts)] if cuts else ["-segment_time", str(seconds + 1)]),
+            "-break_non_keyframes", "0",
+            "-segment_format", "mpegts",
+            "-segment_start_number", str(len(self.entries)),
+            "-segment_list", str(list_path),
+            "-segment_list_type", "csv",
+            str(self.dir / "seg_%05d.ts")
+        ]
+        run_ffmpeg(cmd)
+
+        pieces = [line.rsplit(",", 2) for line in list_path.read_text().splitlines()]
+        list_path.unlink()
+
+        # lengths from the start times: a piece's end in the list is its
+        # last frame's pts plus one nominal frame, which is short when that
+        # frame is held (vfr mode)
+        starts = [0.0] + [float(start) for _, start, _ in pieces[1:]]
+        lengths = [end - start for start, end in zip(starts, starts[1:] + [seconds])]
+
+        # RFC 8216: every EXTINF, rounded, must be within the target duration
+        longest = max(lengths)
+        if round(longest) > HLS_SEGMENT_SECONDS:
+            raise RuntimeError(
+                f"HLS piece of {longest:.3f}s in {seg_path.name} is longer than {HLS_SEGMENT_SECONDS}s; "
+                f"keyframes are not on the {VIDEO_KEYFRAME_SECONDS}s grid"
+            )
+
+        for k, ((name, _, _), length) in enumerate(zip(pieces, lengths)):
+            upload_file("videos", self.dir / name, f"{self.prefix}/{name}", "video/mp2t")
+            self.entries.append((name, length, k == 0))
+
+        self.publish()
+
+        if self.url is None:
+            self.url = supabase.storage.from_("videos").get_public_url(f"{self.prefix}/index.m3u8")
+            update_video(self.video_id, {"hls_url": self.url})
+
+    def target_duration(self) -> int:
+        """
+        Longest piece, rounded. Never below HLS_SEGMENT_SECONDS, so it stays
+        the same while the playlist grows (add_segment rejects longer pieces).
+        """
+        return max([HLS_SEGMENT_SECONDS] + [round(seconds) for _, seconds, _ in self.entries])
+
+    def publish(self, ended: bool = False):
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{self.target_duration()}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+        ]
+        for k, (name, seconds, scene_start) in enumerate(self.entries):
+            if scene_start and k:
+                lines.append("#EXT-X-DISCONTINUITY")
+            lines.append(f"#EXTINF:{seconds:.3f},")
+            lines.append(name)
+        if ended:
+            lines.append("#EXT-X-ENDLIST")
+
+        playlist = self.dir / "index.m3u8"
+        playlist.write_text("\n".join(lines) + "\n")
+
+        # players poll the playlist while it grows, so keep it out of caches
+        upload_file(
+            "videos", playlist, f"{self.prefix}/index.m3u8", "application/vnd.apple.mpegurl",
+            cache_control="1"
+        )
+
+    def close(self) -> str:
+        self.publish(ended=True)
+        shutil.rmtree(self.dir, ignore_errors=True)
+        return self.url
+
+# =========================
+# 8) RENDER JOB QUEUE
+# =========================
+def video_cache_key(lesson: dict, profile: str = FINAL_PROFILE) -> str:
+    return cache_key("video", VIDEO_RENDER_VERSION, RENDER_PROFILES[profile], TTS_VOICE, cache_key(lesson))
+
+
+# renders running at once on this node, all uvicorn workers together
+# (node_render_slot); the rest wait as "queued"
+VIDEO_MAX_CONCURRENT_RENDERS = int(os.getenv("VIDEO_MAX_CONCURRENT_RENDERS", "2"))
+# queued + running per uvicorn worker; beyond this /render-video answers 429
+VIDEO_MAX_QUEUED_RENDERS = int(os.getenv("VIDEO_MAX_QUEUED_RENDERS", "20"))
+
+# one lock file per node-wide render slot; app/outputs is per node and
+# this folder is not swept
+RENDER_LOCKS_DIR = OUT_DIR / "locks"
+RENDER_SLOT_POLL_SECONDS = 1.0
+
+render_executor = ThreadPoolExecutor(
+    max_workers=VIDEO_MAX_CONCURRENT_RENDERS,
+    thread_name_prefix="video-render",
+)
+_render_slots = threading.BoundedSemaphore(VIDEO_MAX_QUEUED_RENDERS)
+
+
+@contextmanager
+def node_render_slot():
+    """
+    Holds one of the VIDEO_MAX_CONCURRENT_RENDERS slots of this node for
+    the block, waiting until one is free. Slots are file locks, so they
+    are shared by every uvicorn worker and freed if a worker dies.
+    """
+    RENDER_LOCKS_DIR.mkdir(parents=True, exist_ok=True)
+
+    while True:
+        for k in range(VIDEO_MAX_CONCURRENT_RENDERS):
+            lock = FileLock(str(RENDER_LOCKS_DIR / f"render_{k}.lock"))
+            try:
+                lock.acquire(timeout=0)
+            except Timeout:
+                continue
+
+            try:
+                yield
+            finally:
+                lock.release()
+            return
+
+        time.sleep(RENDER_SLOT_POLL_SECONDS)
+
+
+def update_video(video_id: str, fields: dict):
+    supabase.table("videos").update(fields).eq("id", video_id).execute()
+
+
+class RenderProgress:
+    """
+    Keeps the videos row's stage / progress (0-100) current. Frame
+    progress is only written every few percent to spare the database.
+    """
+
+    def __init__(self, video_id: str, step: int = 5):
+        self.video_id = video_id
+        self.step = step
+        self.stage_name = None
+        self.progress = 0
+
+    def stage(self, name: str, extra: dict = None):
+        self.stage_name = name
+        self.progress = 0
+        update_video(self.video_id, {"status": "processing", "stage": name, "progress": 0, **(extra or {})})
+
+    def frames(self, done: int, total: int):
+        percent = int(done * 100 / total) if total else 100
+        if percent - self.progress >= self.step or (percent == 100 and self.progress != 100):
+            self.progress = percent
+            update_video(self.video_id, {"progress": percent})
+
+
+def render_lesson_video(video_id: str, lesson: dict, profile: str, name: str, progress: RenderProgress):
+    """
+    TTS + scene segments (+ HLS pieces, uploaded under hls/<name> as they
+    are ready) + final stream copy + poster / preview. Returns
+    (out_mp4, final_audio, hls_url, (poster_path, preview_path)).
+    """
+    # 2) TTS (one clip per scene, concurrent)
+    progress.stage("audio")
+    final_audio = AUDIO_DIR / f"{video_id}.mp3"
+    scene_durs, clip_paths, clip_keys, scene_words = generate_scene_audio(video_id, lesson, final_audio)
+
+    # 3) frames -> one segment per scene
+    progress.stage("frames")
+    hls = HlsPublisher(video_id, name) if VIDEO_HLS else None
+    segments = build_video_segments(
+        video_id, lesson, scene_durs, clip_paths, clip_keys, scene_words,
+        profile=profile, on_frames=progress.frames,
+        on_segment=hls.add_segment if hls else None
+    )
+    hls_url = hls.close() if hls else None
+
+    # 4) mp4 (stream copy of the segments)
+    progress.stage("encode")
+    out_mp4 = VIDEOS_DIR / f"{video_id}.mp4"
+    concat_segments(segments, out_mp4)
+    previews = build_previews(video_id, segments)
+
+    return out_mp4, final_audio, hls_url, previews
+
+
+def finish_video(video_id: str, lesson: dict, profile: str, video_url: str, audio_url: str, hls_url: str,
+                 preview_urls: dict):
+    update_video(video_id, {
+        "status": "done",
+        "stage": "done",
+        "progress": 100,
+        "profile": profile,
+        "video_url": video_url,
+        "audio_url": audio_url,
+        "hls_url": hls_url,
+        **preview_urls
+    })
+
+    get_media_cache().put_json(video_cache_key(lesson, profile), {
+        "video_url": video_url,
+        "audio_url": audio_url,
+        "hls_url": hls_url,
+        **preview_urls
+    })
+
+
+def run_render_pipeline(video_id: str, req: VideoRequest, progress: RenderProgress):
+    # 1) lesson json from Groq (or the lesson cache)
+    progress.stage("lesson")
+    lesson = get_or_generate_lesson(req.topic, req.grade, req.language)
+
+    update_video(video_id, {
+        "title": lesson.get("title"),
+        "lesson_json": lesson
+    })
+
+    name = render_upload_name(video_id, req.profile)
+    out_mp4, final_audio, hls_url, previews = render_lesson_video(video_id, lesson, req.profile, name, progress)
+
+    # 5) upload
+    progress.stage("upload")
+    video_url = upload_file("videos", out_mp4, f"{name}.mp4", "video/mp4")
+    audio_url = upload_file("videos", final_audio, f"{name}.mp3", "audio/mpeg")
+    preview_urls = upload_previews(name, previews)
+
+    finish_video(video_id, lesson, req.profile, video_url, audio_url, hls_url, preview_urls)
+
+
+def run_scene_edit_pipeline(video_id: str, lesson: dict, profile: str, progress: RenderProgress):
+    # new object names so players / CDN don't serve the old cut
+    name = render_upload_name(video_id, profile, cache_key(lesson)[:12])
+
+    # untouched scenes come straight from the TTS and segment caches
+    out_mp4, final_audio, hls_url, previews = render_lesson_video(video_id, lesson, profile, name, progress)
+
+    progress.stage("upload")
+    video_url = upload_file("videos", out_mp4, f"{name}.mp4", "video/mp4")
+    audio_url = upload_file("videos", final_audio, f"{name}.mp3", "audio/mpeg")
+    preview_urls = upload_previews(name, previews)
+
+    finish_video(video_id, lesson, profile, video_url, audio_url, hls_url, preview_urls)
+
+
+def run_final_pipeline(video_id: str, lesson: dict, audio_url: str, progress: RenderProgress):
+    # narration clips come from the TTS cache, so only frames are rendered;
+    # the mp3 is the same as the preview's and is not uploaded again
+    name = render_upload_name(video_id, FINAL_PROFILE)
+    out_mp4, _, hls_url, previews = render_lesson_video(video_id, lesson, FINAL_PROFILE, name, progress)
+
+    progress.stage("upload")
+    video_url = upload_file("videos", out_mp4, f"{name}.mp4", "video/mp4")
+    preview_urls = upload_previews(name, previews)
+
+    finish_video(video_id, lesson, FINAL_PROFILE, video_url, audio_url, hls_url, preview_urls)
+
+
+def render_job_paths(video_id: str):
+    """Local scratch of one render; everything worth keeping is uploaded or cached."""
+    return [
+        AUDIO_DIR / video_id,
+        AUDIO_DIR / f"{video_id}.mp3",
+        FRAMES_DIR / video_id,
+        SEGMENTS_DIR / video_id,
+        HLS_DIR / video_id,
+        VIDEOS_DIR / f"{video_id}.mp4",
+        VIDEOS_DIR / f"{video_id}.jpg",
+        VIDEOS_DIR / f"{video_id}.preview.webp",
+    ]
+
+
+def run_render_job(video_id: str, pipeline, *args, keep: dict = None):
+    """
+    keep: fields of a finished render that stays playable if this one
+    fails (final render of a preview). They are written back with the
+    error in final_error instead of failing the row.
+    """
+    try:
+        # kept away from the outputs sweeper while rendering, deleted after
+        with node_render_slot(), job_outputs(*render_job_paths(video_id)):
+            pipeline(video_id, *args, RenderProgress(video_id))
+
+    except Exception as e:
+        traceback.print_exc()
+
+        if keep is not None:
+            update_video(video_id, {**keep, "final_error": str(e)})
+        else:
+            update_video(video_id, {
+                "status": "failed",
+                "error": str(e)
+            })
+
+    finally:
+        _render_slots.release()
+
 # =========================
 # API: CREATE VIDEO
 # =========================
-@router.post("/render-video")
-def render_video(req: VideoRequest):
+def validate_video_request(req: VideoRequest):
     if req.grade < 3 or req.grade > 8:
         raise HTTPException(status_code=400, detail="Grade must be 3–8")
 
+    if req.profile not in RENDER_PROFILES:
+        raise HTTPException(status_code=400, detail=f"Profile must be one of: {', '.join(RENDER_PROFILES)}")
+
+
+def find_rendered_video(req: VideoRequest):
+    """(lesson, cache entry) if this lesson was already rendered with the current renderer."""
+    cache = get_media_cache()
+    lesson = cache.get_json(lesson_cache_key(req.topic, req.grade, req.language))
+    rendered = cache.get_json(video_cache_key(lesson, req.profile)) if lesson else None
+    return (lesson, rendered) if rendered else None
+
+
+def insert_rendered_video(req: VideoRequest, lesson: dict, rendered: dict, batch_id: str = None):
+    row = supabase.table("videos").insert({
+        "topic": req.topic,
+        "grade": req.grade,
+        "language": req.language,
+        "profile": req.profile,
+        **({"batch_id": batch_id} if batch_id else {}),
+        "title": lesson.get("title"),
+        "lesson_json": lesson,
+        "status": "done",
+        "stage": "done",
+        "progress": 100,
+        "video_url": rendered["video_url"],
+        "audio_url": rendered["audio_url"],
+        "hls_url": rendered.get("hls_url"),
+        "poster_url": rendered.get("poster_url"),
+        "preview_url": rendered.get("preview_url")
+    }).execute()
+
+    return {
+        "id": str(row.data[0]["id"]),
+        "status": "done",
+        "title": lesson.get("title"),
+        "video_url": rendered["video_url"],
+        "hls_url": rendered.get("hls_url"),
+        "poster_url": rendered.get("poster_url"),
+        "preview_url": rendered.get("preview_url")
+    }
+
+
+def queue_video(req: VideoRequest, batch_id: str = None):
+    """
+    Inserts the row and queues the render. The caller holds a render slot
+    for it, which the render job releases; if this raises, the render was
+    not queued and the slot is still the caller's.
+    """
     row = supabase.table("videos").insert({
         "topic": req.topic,
         "grade": req.grade,
         "language": req.language,
-        "status": "processing"
+        "profile": req.profile,
+        **({"batch_id": batch_id} if batch_id else {}),
+        "status": "queued",
+        "stage": "queued",
+        "progress": 0
     }).execute()
 
     video_id = str(row.data[0]["id"])
+    render_executor.submit(run_render_job, video_id, run_render_pipeline, req)
+
+    return {
+        "id": video_id,
+        "status": "queued"
+    }
+
+
+@router.post("/render-video")
+def render_video(req: VideoRequest):
+    validate_video_request(req)
+
+    # same lesson already rendered with the current renderer -> reuse it
+    found = find_rendered_video(req)
+    if found:
+        return insert_rendered_video(req, *found)
+
+    if not _render_slots.acquire(blocking=False):
+        raise HTTPException(status_code=429, detail="Too many videos rendering, try again in a few minutes")
+
+    try:
+        return queue_video(req)
+    except Exception:
+        _render_slots.release()
+        raise
+
+# =========================
+# API: BATCH (WHOLE CHAPTER LIST)
+# =========================
+# topics x grades per batch; of those, at most VIDEO_MAX_QUEUED_RENDERS
+# may still need rendering (already rendered lessons take no queue slot)
+VIDEO_MAX_BATCH_ITEMS = int(os.getenv("VIDEO_MAX_BATCH_ITEMS", "50"))
+
+# share of a render done when it enters a stage ("frames" adds its own progress)
+RENDER_STAGE_WEIGHTS = {
+    "queued": 0.0,
+    "lesson": 0.02,
+    "audio": 0.05,
+    "frames": 0.15,
+    "encode": 0.85,
+    "upload": 0.9,
+    "done": 1.0,
+}
+
+
+class VideoBatchRequest(BaseModel):
+    topics: List[str]
+    grades: List[int] = [5]
+    language: str = "hinglish"
+    profile: str = "final"
+
+
+@router.post("/render-batch")
+def render_batch(batch: VideoBatchRequest):
+    """
+    One video per topic x grade, all queued at once on the shared render
+    pool. Repeated lessons are rendered once; lessons and narration
+    shared between renders are generated once (see _flights).
+    """
+    reqs = {}
+    for topic in batch.topics:
+        for grade in batch.grades:
+            req = VideoRequest(topic=topic, grade=grade, language=batch.language, profile=batch.profile)
+            validate_video_request(req)
+            reqs.setdefault(lesson_cache_key(req.topic, req.grade, req.language), req)
+
+    if not reqs:
+        raise HTTPException(status_code=400, detail="No topics given")
+
+    if len(reqs) > VIDEO_MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {VIDEO_MAX_BATCH_ITEMS} videos per batch")
+
+    found = {k: find_rendered_video(req) for k, req in reqs.items()}
+    to_render = [k for k, f in found.items() if not f]
+
+    # slots are taken all or nothing, so a bigger batch would get 429 forever
+    if len(to_render) > VIDEO_MAX_QUEUED_RENDERS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{len(to_render)} videos need rendering; at most {VIDEO_MAX_QUEUED_RENDERS} per batch, "
+                   f"split the batch"
+        )
+
+    # all or nothing: a half-queued chapter is harder to retry than a 429
+    held = 0
+    while held < len(to_render) and _render_slots.acquire(blocking=False):
+        held += 1
+
+    if held < len(to_render):
+        for _ in range(held):
+            _render_slots.release()
+        raise HTTPException(status_code=429, detail="Too many videos rendering, try again in a few minutes")
+
+    batch_id = uuid.uuid4().hex
+    items = []
+    queued = 0  # slots handed over to render jobs
 
     try:
-        # 1) lesson json from Groq
-        lesson = generate_lesson(req.topic, req.grade, req.language)
+        for k, req in reqs.items():
+            if found[k]:
+                item = insert_rendered_video(req, *found[k], batch_id=batch_id)
+            else:
+                item = queue_video(req, batch_id=batch_id)
+                queued += 1
+            items.append({"topic": req.topic, "grade": req.grade, **item})
 
-        supabase.table("videos").update({
-            "title": lesson.get("title"),
-            "lesson_json": lesson
-        }).eq("id", video_id).execute()
+    except Exception:
+        # give back the slots of the renders that were never queued
+        for _ in range(held - queued):
+            _render_slots.release()
+        raise
+
+    return {
+        "batch_id": batch_id,
+        "total": len(items),
+        "items": items
+    }
+
+
+def render_fraction(row: dict) -> float:
+    if row.get("status") == "done":
+        return 1.0
+    if row.get("status") == "failed":
+        return 0.0
+
+    stage = row.get("stage") or "queued"
+    done = RENDER_STAGE_WEIGHTS.get(stage, 0.0)
+    if stage == "frames":
+        done += (RENDER_STAGE_WEIGHTS["encode"] - done) * (row.get("progress") or 0) / 100
+    return done
+
+
+@router.get("/batch/{batch_id}")
+def batch_status(batch_id: str):
+    res = supabase.table("videos") \
+        .select("id,topic,grade,status,stage,progress,profile,title,video_url,hls_url,poster_url,preview_url,error") \
+        .eq("batch_id", batch_id) \
+        .execute()
+
+    if not res.data:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    rows = res.data
+    counts = {s: 0 for s in ("queued", "processing", "done", "failed")}
+    for row in rows:
+        counts[row["status"]] = counts.get(row["status"], 0) + 1
+
+    finished = counts["done"] + counts["failed"] == len(rows)
+
+    return {
+        "batch_id": batch_id,
+        "status": "done" if finished else "processing",
+        "total": len(rows),
+        **counts,
+        "progress": int(100 * sum(render_fraction(r) for r in rows) / len(rows)),
+        "items": rows
+    }
 
-        # 2) TTS (single call)
-        final_audio = AUDIO_DIR / f"{video_id}.mp3"
+# =========================
+# API: EDIT ONE SCENE
+# =========================
+class SceneEdit(BaseModel):
+    narration: Optional[str] = None
+    subtitle: Optional[str] = None
+    example: Optional[dict] = None
 
-        full_narration = "\n\n".join([
-            f"Scene {i+1}. {s.get('narration','')}"
-            for i, s in enumerate(lesson["scenes"])
-        ])
 
-        generate_tts_audio(full_narration, final_audio)
+@router.post("/{video_id}/scenes/{scene_number}")
+def edit_scene(video_id: str, scene_number: int, edit: SceneEdit):
+    """
+    Applies a teacher's fix to one scene (1-based) of a finished video and
+    rebuilds only that scene's audio and segment; the rest is reused.
+    """
+    res = supabase.table("videos") \
+        .select("id,status,profile,lesson_json") \
+        .eq("id", video_id) \
+        .limit(1) \
+        .execute()
 
-        # 3) frames
-        frames_folder, fps = create_frames_for_video(video_id, lesson, final_audio)
+    if not res.data or not res.data[0].get("lesson_json"):
+        raise HTTPException(status_code=404, detail="Video not found")
 
-        # 4) mp4
-        out_mp4 = VIDEOS_DIR / f"{video_id}.mp4"
-        render_video_ffmpeg(frames_folder, fps, final_audio, out_mp4)
+    row = res.data[0]
+    if row["status"] in ("queued", "processing"):
+        raise HTTPException(status_code=409, detail="Video is still rendering")
 
-        # 5) upload
-        video_url = upload_file("videos", out_mp4, f"{video_id}.mp4", "video/mp4")
-        audio_url = upload_file("videos", final_audio, f"{video_id}.mp3", "audio/mpeg")
+    lesson = row["lesson_json"]
+    scenes = lesson.get("scenes", [])
+    if scene_number < 1 or scene_number > len(scenes):
+        raise HTTPException(status_code=400, detail=f"Scene must be 1–{len(scenes)}")
 
-        supabase.table("videos").update({
-            "status": "done",
-            "video_url": video_url,
-            "audio_url": audio_url
-        }).eq("id", video_id).execute()
+    changes = edit.model_dump(exclude_none=True)
+    if not changes:
+        raise HTTPException(status_code=400, detail="Nothing to change")
+
+    scene = dict(scenes[scene_number - 1])
+    if "example" in changes:
+        changes["example"] = {**scene.get("example", {}), **changes["example"]}
+    scene.update(changes)
+    scenes[scene_number - 1] = scene
+
+    if not _render_slots.acquire(blocking=False):
+        raise HTTPException(status_code=429, detail="Too many videos rendering, try again in a few minutes")
+
+    try:
+        update_video(video_id, {
+            "lesson_json": lesson,
+            "status": "queued",
+            "stage": "queued",
+            "progress": 0,
+            "error": None
+        })
+        profile = row.get("profile") or FINAL_PROFILE
+        render_executor.submit(run_render_job, video_id, run_scene_edit_pipeline, lesson, profile)
+
+    except Exception:
+        _render_slots.release()
+        raise
+
+    return {
+        "id": video_id,
+        "status": "queued",
+        "scene": scene_number
+    }
+
+# =========================
+# API: FINAL RENDER OF A PREVIEW
+# =========================
+@router.post("/{video_id}/final")
+def render_final(video_id: str):
+    """
+    Re-renders a finished draft / preview with the final profile. The
+    lesson and narration audio of the preview are reused as they are.
+    """
+    res = supabase.table("videos") \
+        .select("id,status,profile,title,lesson_json,audio_url,hls_url") \
+        .eq("id", video_id) \
+        .limit(1) \
+        .execute()
+
+    if not res.data or not res.data[0].get("lesson_json"):
+        raise HTTPException(status_code=404, detail="Video not found")
+
+    row = res.data[0]
+    if row["status"] != "done":
+        raise HTTPException(status_code=409, detail="Video is not finished yet")
+
+    if (row.get("profile") or FINAL_PROFILE) == FINAL_PROFILE:
+        raise HTTPException(status_code=400, detail="Video is already a final render")
+
+    lesson = row["lesson_json"]
+
+    # final cut of this lesson already exists -> just point the row at it
+    rendered = get_media_cache().get_json(video_cache_key(lesson, FINAL_PROFILE))
+    if rendered:
+        update_video(video_id, {
+            "profile": FINAL_PROFILE,
+            "video_url": rendered["video_url"],
+            "audio_url": rendered["audio_url"],
+            "hls_url": rendered.get("hls_url"),
+            "poster_url": rendered.get("poster_url"),
+            "preview_url": rendered.get("preview_url")
+        })
 
         return {
             "id": video_id,
             "status": "done",
-            "title": lesson.get("title"),
-            "video_url": video_url
+            "title": row.get("title"),
+            "video_url": rendered["video_url"],
+            "hls_url": rendered.get("hls_url"),
+            "poster_url": rendered.get("poster_url"),
+            "preview_url": rendered.get("preview_url")
         }
 
-    except Exception as e:
-        traceback.print_exc()
+    if not _render_slots.acquire(blocking=False):
+        raise HTTPException(status_code=429, detail="Too many videos rendering, try again in a few minutes")
+
+    try:
+        # profile flips to final only once the final cut is uploaded;
+        # if it fails the row goes back to the preview, which still plays
+        update_video(video_id, {
+            "status": "queued",
+            "stage": "queued",
+            "progress": 0,
+            "error": None,
+            "final_error": None
+        })
+        preview = {"status": "done", "stage": "done", "progress": 100, "hls_url": row.get("hls_url")}
+        render_executor.submit(
+            run_render_job, video_id, run_final_pipeline, lesson, row.get("audio_url"), keep=preview
+        )
+
+    except Exception:
+        _render_slots.release()
+        raise
 
-        supabase.table("videos").update({
-            "status": "failed",
-            "error": str(e)
-        }).eq("id", video_id).execute()
+    return {
+        "id": video_id,
+        "status": "queued"
+    }
 
-        raise HTTPException(status_code=500, detail=str(e))
+# =========================
+# API: RENDER STATUS
+# =========================
+@router.get("/status/{video_id}")
+def video_status(video_id: str):
+    res = supabase.table("videos") \
+        .select("id,status,stage,progress,profile,title,video_url,audio_url,hls_url,poster_url,preview_url,error,final_error") \
+        .eq("id", video_id) \
+        .limit(1) \
+        .execute()
+
+    if not res.data:
+        raise HTTPException(status_code=404, detail="Video not found")
+
+    return res.data[0]
@@ -0,0 +1,188 @@
+import os
+import time
+import shutil
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = Path(__file__).resolve().parents[1]
+OUTPUTS_DIR = APP_DIR / "outputs"
+
+OUTPUTS_SWEEP_INTERVAL = int(os.getenv("OUTPUTS_SWEEP_INTERVAL", "600"))  # seconds
+
+
+def _policy(name: str, max_age_hours: float, quota_mb: int) -> dict:
+    """Defaults, overridable per directory with OUTPUTS_<NAME>_MAX_AGE_HOURS / _QUOTA_MB."""
+    env = name.upper()
+    return {
+        "max_age": float(os.getenv(f"OUTPUTS_{env}_MAX_AGE_HOURS", str(max_age_hours))) * 3600,
+        "quota": int(os.getenv(f"OUTPUTS_{env}_QUOTA_MB", str(quota_mb))) * 1024 * 1024,
+    }
+
+
+# Scratch space under app/outputs. Each top-level entry of these
+# directories (a file or a job's folder) is removed once it is older than
+# max_age, or oldest first while the directory is over its quota.
+# "cache" is not listed: the media cache evicts on its own.
+RETENTION_POLICIES = {
+    "frames": _policy("frames", 1, 2048),
+    "audio": _policy("audio", 6, 1024),
+    "segments": _policy("segments", 6, 2048),
+    "videos": _policy("videos", 6, 2048),
+    "hls": _policy("hls", 6, 1024),
+    "doubts": _policy("doubts", 24, 512),
+    "sheets": _policy("sheets", 1, 512),
+}
+
+_active = {}  # path -> number of running jobs using it
+_active_lock = threading.Lock()
+
+
+def _size(p: Path):
+    """(bytes, files, newest mtime) of a file or a whole folder."""
+    try:
+        if not p.is_dir():
+            st = p.stat()
+            return st.st_size, 1, st.st_mtime
+
+        total, files, newest = 0, 0, p.stat().st_mtime
+        for root, _, names in os.walk(p):
+            for name in names:
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                total += st.st_size
+                files += 1
+                newest = max(newest, st.st_mtime)
+        return total, files, newest
+
+    except FileNotFoundError:
+        return 0, 0, 0
+
+
+def remove_path(p: Path):
+    p = Path(p)
+    if p.is_dir():
+        shutil.rmtree(p, ignore_errors=True)
+    else:
+        p.unlink(missing_ok=True)
+
+
+@contextmanager
+def job_outputs(*paths):
+    """
+    Marks a job's scratch files / folders as in use, so the sweeper leaves
+    them alone, and deletes them when the job ends (done or failed).
+    """
+    paths = [Path(p).resolve() for p in paths]
+
+    with _active_lock:
+        for p in paths:
+            _active[p] = _active.get(p, 0) + 1
+
+    try:
+        yield paths
+    finally:
+        with _active_lock:
+            for p in paths:
+                _active[p] -= 1
+                if not _active[p]:
+                    del _active[p]
+
+            # another job may be using the same path (same video id twice)
+            done = [p for p in paths if p not in _active]
+
+        for p in done:
+            remove_path(p)
+
+
+def _in_use(p: Path) -> bool:
+    p = p.resolve()
+    with _active_lock:
+        return any(p == a or a in p.parents or p in a.parents for a in _active)
+
+
+def sweep_outputs(now: float = None) -> dict:
+    """
+    One pass over RETENTION_POLICIES: drops expired entries, then the
+    oldest ones while a directory is over quota. Returns
+    {dir: {"removed": n, "freed_bytes": b}}.
+    """
+    now = now or time.time()
+    report = {}
+
+    for name, policy in RETENTION_POLICIES.items():
+        folder = OUTPUTS_DIR / name
+        removed, freed = 0, 0
+
+        entries = []
+        if folder.is_dir():
+            for p in folder.iterdir():
+                if _in_use(p):
+                    continue
+                size, _, mtime = _size(p)
+                entries.append((mtime, size, p))
+
+        # oldest first
+        entries.sort(key=lambda e: e[0])
+        total = sum(size for _, size, _ in entries)
+
+        for mtime, size, p in entries:
+            if now - mtime <= policy["max_age"] and total <= policy["quota"]:
+                break
+            remove_path(p)
+            total -= size
+            removed += 1
+            freed += size
+
+        if removed:
+            logger.info("outputs sweep: %s removed %d entries (%d bytes)", name, removed, freed)
+        report[name] = {"removed": removed, "freed_bytes": freed}
+
+    return report
+
+
+def disk_usage_report() -> dict:
+    """Bytes / files per app/outputs directory plus free space on the volume."""
+    dirs = {}
+    if OUTPUTS_DIR.is_dir():
+        for p in sorted(OUTPUTS_DIR.iterdir()):
+            if not p.is_dir():
+                continue
+            size, files, _ = _size(p)
+            policy = RETENTION_POLICIES.get(p.name)
+            dirs[p.name] = {
+                "bytes": size,
+                "files": files,
+                "quota_bytes": policy["quota"] if policy else None,
+                "max_age_seconds": policy["max_age"] if policy else None,
+            }
+
+    disk = shutil.disk_usage(OUTPUTS_DIR if OUTPUTS_DIR.exists() else APP_DIR)
+
+    with _active_lock:
+        active = len(_active)
+
+    return {
+        "outputs_dir": str(OUTPUTS_DIR),
+        "total_bytes": sum(d["bytes"] for d in dirs.values()),
+        "dirs": dirs,
+        "active_job_paths": active,
+        "disk": {"total": disk.total, "used": disk.used, "free": disk.free},
+    }
+
+
+async def run_sweeper(interval: int = OUTPUTS_SWEEP_INTERVAL):
+    """Background task: sweep_outputs() every interval seconds."""
+    while True:
+        try:
+            await asyncio.to_thread(sweep_outputs)
+        except Exception:
+            logger.exception("outputs sweep failed")
+        await asyncio.sleep(interval)
@@ -0,0 +1,211 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+
+APP_DIR = Path(__file__).resolve().parents[1]
+
+MEDIA_CACHE_BACKEND = os.getenv("MEDIA_CACHE_BACKEND", "local").strip().lower()
+MEDIA_CACHE_DIR = Path(os.getenv("MEDIA_CACHE_DIR", str(APP_DIR / "outputs" / "cache")))
+MEDIA_CACHE_MAX_MB = int(os.getenv("MEDIA_CACHE_MAX_MB", "1024"))
+
+
+def cache_key(*parts) -> str:
+    """sha256 over the JSON form of parts (stable for dicts / unicode)."""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class CacheBackend:
+    """
+    Content-addressed store. Keys are hex digests (see cache_key); a
+    suffix like ".mp3" or ".json" tells entries for the same key apart.
+    """
+
+    def get_file(self, key: str, suffix: str, dest: Path) -> bool:
+        """Copies the entry to dest. False on a miss."""
+        raise NotImplementedError
+
+    def put_file(self, key: str, suffix: str, src: Path):
+        raise NotImplementedError
+
+    def get_json(self, key: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def put_json(self, key: str, value: dict):
+        raise NotImplementedError
+
+    def delete(self, key: str, suffix: str):
+        raise NotImplementedError
+
+
+class LocalDiskCache(CacheBackend):
+    """
+    Files under root/<key[:2]>/<key><suffix>. A hit bumps the file's
+    mtime; when the total passes max_bytes the least recently used
+    entries are removed until it is back under 90%.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = sum(p.stat().st_size for p in self._entries())
+
+    def _entries(self):
+        # ".<name>.tmp" files are puts still in flight
+        return (p for p in self.root.glob("*/*") if p.is_file() and not p.name.startswith("."))
+
+    def _path(self, key: str, suffix: str) -> Path:
+        return self.root / key[:2] / f"{key}{suffix}"
+
+    def _touch(self, p: Path) -> bool:
+        try:
+            os.utime(p)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def get_file(self, key: str, suffix: str, dest: Path) -> bool:
+        p = self._path(key, suffix)
+        if not self._touch(p):
+            return False
+
+        try:
+            shutil.copyfile(p, dest)
+        except FileNotFoundError:
+            # evicted between touch and copy
+            return False
+        return True
+
+    def put_file(self, key: str, suffix: str, src: Path):
+        p = self._path(key, suffix)
+        p.parent.mkdir(parents=True, exist_ok=True)
+
+        # write aside then rename so readers never see half a file
+        tmp = p.with_name(f".{p.name}.{threading.get_ident()}.tmp")
+        shutil.copyfile(src, tmp)
+        self._commit(tmp, p)
+
+    def get_json(self, key: str) -> Optional[dict]:
+        p = self._path(key, ".json")
+        if not self._touch(p):
+            return None
+
+        try:
+            return json.loads(p.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put_json(self, key: str, value: dict):
+        p = self._path(key, ".json")
+        p.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp = p.with_name(f".{p.name}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(value, ensure_ascii=False), encoding="utf-8")
+        self._commit(tmp, p)
+
+    def delete(self, key: str, suffix: str):
+        p = self._path(key, suffix)
+        with self._lock:
+            try:
+                size = p.stat().st_size
+                p.unlink()
+                self._size -= size
+            except FileNotFoundError:
+                pass
+
+    def _commit(self, tmp: Path, p: Path):
+        with self._lock:
+            old = p.stat().st_size if p.exists() else 0
+            new = tmp.stat().st_size
+            os.replace(tmp, p)
+            self._size += new - old
+
+            if self._size > self.max_bytes:
+                self._evict(int(self.max_bytes * 0.9))
+
+    def _evict(self, target: int):
+        entries = []
+        for p in self._entries():
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+
+        # oldest first
+        entries.sort(key=lambda e: e[0])
+        self._size = sum(size for _, size, _ in entries)
+
+        for _, size, p in entries:
+            if self._size <= target:
+                break
+            try:
+                p.unlink()
+                self._size -= size
+            except FileNotFoundError:
+                pass
+
+
+class SingleFlight:
+    """
+    In-process dedupe of cache misses: while one thread produces an entry
+    (the leader), others asking for the same key wait for it and then
+    read the cache instead of doing the same work again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events: Dict[str, threading.Event] = {}
+
+    def lead(self, key: str) -> bool:
+        """True if the caller should produce key (and call done(key) after)."""
+        with self._lock:
+            if key in self._events:
+                return False
+            self._events[key] = threading.Event()
+            return True
+
+    def done(self, key: str):
+        with self._lock:
+            event = self._events.pop(key, None)
+        if event:
+            event.set()
+
+    def wait(self, key: str, timeout: Optional[float] = None):
+        """Blocks until the current leader of key (if any) is done."""
+        with self._lock:
+            event = self._events.get(key)
+        if event:
+            event.wait(timeout)
+
+
+# =========================
+# BACKEND REGISTRY
+# =========================
+_factories: Dict[str, Callable[[], CacheBackend]] = {
+    "local": lambda: LocalDiskCache(MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_MB * 1024 * 1024),
+}
+_instance: Optional[CacheBackend] = None
+_instance_lock = threading.Lock()
+
+
+def register_cache_backend(name: str, factory: Callable[[], CacheBackend]):
+    """Makes MEDIA_CACHE_BACKEND=<name> use factory() (e.g. an S3 / Redis store)."""
+    _factories[name] = factory
+
+
+def get_media_cache() -> CacheBackend:
+    global _instance
+    with _instance_lock:
+        if _instance is None:
+            if MEDIA_CACHE_BACKEND not in _factories:
+                raise RuntimeError(f"Unknown MEDIA_CACHE_BACKEND: {MEDIA_CACHE_BACKEND}")
+            _instance = _factories[MEDIA_CACHE_BACKEND]()
+        return _instance
@@ -0,0 +1,160 @@
+import os
+import hashlib
+import logging
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+from fastapi import HTTPException
+from PIL import Image, ImageFont, features
+
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = Path(__file__).resolve().parents[1]
+ASSETS_DIR = APP_DIR / "Assets"
+FONTS_DIR = ASSETS_DIR / "fonts"
+SPRITES_DIR = APP_DIR / "outputs" / "assets"
+
+TEACHER_SIZE = (380, 560)
+# scene_index % 4 picks the pose
+TEACHER_POSES = ("teacher_idle.png", "teacher_point.png", "teacher_think.png", "teacher_happy.png")
+
+# big / small / tiny (subtitle / board / bubble), at scale 1 (1280x720 frames)
+FONT_SIZES = (58, 40, 34)
+
+# per script: env override first, then the bundled font, then common system fonts
+FONT_CANDIDATES = {
+    "latin": (
+        os.getenv("VIDEO_FONT_PATH", "").strip(),
+        str(FONTS_DIR / "NotoSans-Regular.ttf"),
+        "arial.ttf",
+        "DejaVuSans.ttf",
+        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+        "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+    ),
+    # Hindi lessons; a scene is drawn with one font, so these need Latin
+    # letters too (the bundled one has them merged in, see fonts/README.md).
+    # Conjuncts and vowel signs are shaped right only when Pillow has
+    # libraqm (it is picked automatically when installed).
+    "devanagari": (
+        os.getenv("VIDEO_FONT_PATH_DEVANAGARI", "").strip(),
+        str(FONTS_DIR / "NotoSansDevanagariLatin-Regular.ttf"),
+        "NotoSansDevanagari-Regular.ttf",
+        "/usr/share/fonts/truetype/noto/NotoSansDevanagari-Regular.ttf",
+        "/usr/share/fonts/opentype/noto/NotoSansDevanagari-Regular.ttf",
+        "/usr/share/fonts/truetype/lohit-devanagari/Lohit-Devanagari.ttf",
+        "Mangal.ttf",
+        "Nirmala.ttf",
+    ),
+}
+
+_sheet_lock = threading.Lock()
+
+
+def _teacher_sources():
+    paths = [ASSETS_DIR / name for name in TEACHER_POSES]
+    for p in paths:
+        if not p.exists():
+            raise HTTPException(status_code=500, detail=f"Missing teacher asset: {p}")
+    return paths
+
+
+def teacher_sheet_path(size, lite: bool) -> Path:
+    """Sprite sheet file for these sources / size / filter (name changes when any does)."""
+    h = hashlib.sha256(f"{size[0]}x{size[1]}:{int(lite)}".encode())
+    for p in _teacher_sources():
+        h.update(p.read_bytes())
+    return SPRITES_DIR / f"teacher_{h.hexdigest()[:16]}.png"
+
+
+def build_teacher_sheet(size, lite: bool) -> Path:
+    """
+    Scales every pose once and stores them side by side in one PNG, so
+    renders (and every pool process) only decode one small file.
+    """
+    path = teacher_sheet_path(size, lite)
+
+    with _sheet_lock:
+        if path.exists():
+            return path
+
+        resample = Image.BILINEAR if lite else Image.BICUBIC
+        w, h = size
+        sheet = Image.new("RGBA", (w * len(TEACHER_POSES), h))
+
+        for i, p in enumerate(_teacher_sources()):
+            sprite = Image.open(p).convert("RGBA").resize(size, resample)
+            sheet.paste(sprite, (i * w, 0))
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        sheet.save(tmp, "PNG")
+        os.replace(tmp, path)
+
+    return path
+
+
+def scaled_size(size, scale: float = 1.0):
+    """size (w, h) for frames scale times the 1280x720 layout."""
+    return tuple(max(1, round(v * scale)) for v in size)
+
+
+@lru_cache(maxsize=None)
+def teacher_sprites(size, lite: bool = False):
+    """The poses scaled to size, in TEACHER_POSES order. Loaded once per process."""
+    path = build_teacher_sheet(tuple(size), lite)
+    sheet = Image.open(path).convert("RGBA")
+
+    w, h = size
+    return tuple(sheet.crop((i * w, 0, (i + 1) * w, h)) for i in range(len(TEACHER_POSES)))
+
+
+@lru_cache(maxsize=None)
+def load_fonts(script: str = "latin", scale: float = 1.0):
+    """
+    (big, small, tiny) fonts for a script (see text_layout.text_script),
+    FONT_SIZES times scale, loaded once per process. Falls back to the
+    Latin set, then to the scalable font bundled with Pillow.
+    """
+    sizes = scaled_size(FONT_SIZES, scale)
+
+    for name in FONT_CANDIDATES.get(script, ()):
+        if not name:
+            continue
+        try:
+            fonts = tuple(ImageFont.truetype(name, size) for size in sizes)
+        except OSError:
+            continue
+
+        if script == "devanagari" and not features.check("raqm"):
+            logger.warning("Pillow has no libraqm: Devanagari vowel signs and conjuncts will be misplaced")
+        return fonts
+
+    if script != "latin":
+        logger.warning("no %s font found, %s text falls back to the Latin fonts and may show as boxes", script, script)
+        return load_fonts("latin", scale)
+
+    try:
+        return tuple(ImageFont.load_default(size=size) for size in sizes)
+    except TypeError:
+        # Pillow < 10.1 has only the fixed-size bitmap font
+        font = ImageFont.load_default()
+        return font, font, font
+
+
+def prepare_render_assets(variants=((1.0, False),)):
+    """
+    Builds the sprite sheets and loads the fonts for each (scale, lite)
+    variant (video_generation.RENDER_ASSET_VARIANTS). Run at startup, or
+    at image build time with: python -m app.services.render_assets
+    """
+    for scale, lite in variants:
+        teacher_sprites(scaled_size(TEACHER_SIZE, scale), lite)
+        for script in FONT_CANDIDATES:
+            load_fonts(script, scale)
+
+
+if __name__ == "__main__":
+    prepare_render_assets()
+    print(f"sprite sheets in {SPRITES_DIR}")
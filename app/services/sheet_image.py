@@ -0,0 +1,181 @@
+import io
+import os
+import uuid
+import logging
+from contextlib import contextmanager
+
+from pdf2image import convert_from_path, pdfinfo_from_path
+from PIL import Image, ImageOps
+
+from app.services.disk_lifecycle import OUTPUTS_DIR, job_outputs
+
+
+logger = logging.getLogger(__name__)
+
+# Longest side sent to the vision model. gpt-4o reads a page at most
+# 2048 px long with the short side at 768 px, so ~1600 keeps an A4 scan
+# at full detail while a 12 MP phone photo shrinks ~20x in bytes.
+SHEET_MAX_EDGE = int(os.getenv("ANSWER_SHEET_MAX_EDGE", "1600"))
+SHEET_FORMAT = os.getenv("ANSWER_SHEET_IMAGE_FORMAT", "jpeg").strip().lower()  # jpeg | webp
+SHEET_QUALITY = int(os.getenv("ANSWER_SHEET_IMAGE_QUALITY", "80"))
+
+# pixels darker than this count as writing when looking for the margins
+MARGIN_INK_LEVEL = 200
+MARGIN_PAD = 0.02  # of the page size, kept around the writing
+# the paper is found on a copy this small (the desk / table around it is cut first)
+PAPER_PROBE_EDGE = 256
+
+# PDF booklets: pages are rasterised one at a time at this resolution
+# (A4 at 150 dpi is 1240x1754, about SHEET_MAX_EDGE)
+SHEET_PDF_DPI = int(os.getenv("ANSWER_SHEET_PDF_DPI", "150"))
+SHEETS_DIR = OUTPUTS_DIR / "sheets"
+
+FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+
+def otsu_level(histogram) -> int:
+    """Gray level that best splits a 256-bin histogram into dark and bright (Otsu)."""
+    total = sum(histogram)
+    total_sum = sum(i * n for i, n in enumerate(histogram))
+
+    best, level = -1.0, 0
+    dark, dark_sum = 0, 0
+    for i, n in enumerate(histogram):
+        dark += n
+        dark_sum += i * n
+        if dark == 0 or dark == total:
+            continue
+        spread = dark * (total - dark) * (dark_sum / dark - (total_sum - dark_sum) / (total - dark)) ** 2
+        if spread > best:
+            best, level = spread, i
+    return level
+
+
+def longest_run(values, threshold: int = 128):
+    """(start, end) of the longest run of values >= threshold, or None."""
+    best, start = None, None
+    for i, v in enumerate(list(values) + [0]):
+        if v >= threshold and start is None:
+            start = i
+        elif v < threshold and start is not None:
+            if best is None or i - start > best[1] - best[0]:
+                best = (start, i)
+            start = None
+    return best
+
+
+def paper_box(gray: Image.Image):
+    """
+    Box of the sheet of paper in a photo: the rows and columns that are
+    mostly brighter than the background (Otsu level on a small copy).
+    The whole image for scans, where the page fills the frame.
+    """
+    w, h = gray.size
+    small = gray.copy()
+    small.thumbnail((PAPER_PROBE_EDGE, PAPER_PROBE_EDGE))
+    sw, sh = small.size
+
+    level = otsu_level(small.histogram())
+    bright = small.point(lambda v: 255 if v > level else 0)
+
+    # share of bright pixels per column / row
+    cols = longest_run(bright.resize((sw, 1), Image.BOX).getdata())
+    rows = longest_run(bright.resize((1, sh), Image.BOX).getdata())
+    if not cols or not rows or (cols == (0, sw) and rows == (0, sh)):
+        return 0, 0, w, h
+
+    # one probe pixel in from each side, so the paper's edge (and its
+    # shadow) is not taken for writing
+    left, right = min(cols[0] + 1, cols[1] - 1), max(cols[1] - 1, cols[0] + 1)
+    top, bottom = min(rows[0] + 1, rows[1] - 1), max(rows[1] - 1, rows[0] + 1)
+    return left * w // sw, top * h // sh, right * w // sw, bottom * h // sh
+
+
+def crop_margins(gray: Image.Image) -> Image.Image:
+    """Crops the background around the paper, then the empty paper around the writing (with a small border)."""
+    page = gray.crop(paper_box(gray))
+
+    ink = page.point(lambda v: 255 if v < MARGIN_INK_LEVEL else 0)
+    box = ink.getbbox()
+    if not box:
+        return page
+
+    w, h = page.size
+    pad_x, pad_y = int(w * MARGIN_PAD), int(h * MARGIN_PAD)
+    left, top, right, bottom = box
+    box = (max(0, left - pad_x), max(0, top - pad_y), min(w, right + pad_x), min(h, bottom + pad_y))
+
+    # a few specks on an empty page: keep the page as it is
+    if (box[2] - box[0]) * (box[3] - box[1]) < w * h * 0.05:
+        return page
+    return page.crop(box)
+
+
+def encode_sheet(im: Image.Image, max_edge: int = SHEET_MAX_EDGE, fmt: str = SHEET_FORMAT,
+                 quality: int = SHEET_QUALITY):
+    """Upright page image -> grayscale, cropped, capped, encoded (bytes, mime type)."""
+    pil_format, mime = FORMATS.get(fmt, FORMATS["jpeg"])
+
+    gray = crop_margins(im.convert("L"))
+    if max(gray.size) > max_edge:
+        gray.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    out = io.BytesIO()
+    gray.save(out, pil_format, quality=quality, optimize=pil_format == "JPEG")
+    return out.getvalue(), mime
+
+
+def prepare_sheet_image(data: bytes, max_edge: int = SHEET_MAX_EDGE, fmt: str = SHEET_FORMAT,
+                        quality: int = SHEET_QUALITY):
+    """
+    Answer sheet photo / scan -> (bytes, mime type) for the vision model:
+    turned upright (EXIF), grayscale, margins cropped, longest side at
+    most max_edge, re-encoded as JPEG or WebP. Anything Pillow cannot
+    read is returned unchanged.
+    """
+    try:
+        im = Image.open(io.BytesIO(data))
+
+        # JPEG: let the decoder scale down (much faster on 12 MP photos)
+        scale = max_edge / max(im.size)
+        if scale < 1:
+            im.draft("L", (int(im.size[0] * scale), int(im.size[1] * scale)))
+
+        return encode_sheet(ImageOps.exif_transpose(im), max_edge, fmt, quality)
+
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning("sheet image not preprocessed: %s", e)
+        return data, "image/png"
+
+
+def is_pdf(data: bytes) -> bool:
+    return data[:5] == b"%PDF-"
+
+
+@contextmanager
+def pdf_file(data: bytes):
+    """
+    Writes an uploaded PDF once under app/outputs/sheets for poppler to
+    read page by page; removed when the block ends.
+    """
+    path = SHEETS_DIR / f"{uuid.uuid4().hex}.pdf"
+    with job_outputs(path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        yield path
+
+
+def pdf_page_count(path) -> int:
+    return int(pdfinfo_from_path(str(path))["Pages"])
+
+
+def prepare_pdf_page(path, page: int, dpi: int = SHEET_PDF_DPI):
+    """
+    Rasterises one page (1-based) of a PDF and encodes it like
+    prepare_sheet_image. Only this page is ever decoded in memory.
+    """
+    im = convert_from_path(str(path), dpi=dpi, first_page=page, last_page=page, grayscale=True)[0]
+    return encode_sheet(im)
@@ -0,0 +1,175 @@
+import os
+import base64
+import time
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+import requests
+
+
+# Supabase's resumable (TUS) endpoint only accepts 6 MB chunks
+STORAGE_UPLOAD_CHUNK_BYTES = 6 * 1024 * 1024
+STORAGE_UPLOAD_RETRIES = int(os.getenv("STORAGE_UPLOAD_RETRIES", "3"))
+STORAGE_UPLOAD_TIMEOUT = int(os.getenv("STORAGE_UPLOAD_TIMEOUT", "60"))
+
+
+class StorageUploadError(RuntimeError):
+    pass
+
+
+def _storage_config():
+    # read per call: routers load their .env after this module is imported
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_KEY")
+    if not url or not key:
+        raise StorageUploadError("SUPABASE_URL or SUPABASE_KEY missing in env")
+    return url.rstrip("/") + "/storage/v1", key
+
+
+def _headers(key: str, upsert: bool) -> dict:
+    return {
+        "Authorization": f"Bearer {key}",
+        "apikey": key,
+        "x-upsert": "true" if upsert else "false",
+    }
+
+
+def _b64(value: str) -> str:
+    return base64.b64encode(value.encode("utf-8")).decode("ascii")
+
+
+class _Window:
+    """
+    File-like view of the next length bytes of stream. requests sends it
+    with a Content-Length and reads it in small blocks.
+    """
+
+    def __init__(self, stream: BinaryIO, length: int):
+        self.stream = stream
+        self.remaining = length
+
+    def __len__(self):
+        return self.remaining
+
+    def read(self, n: int = -1) -> bytes:
+        if n is None or n < 0 or n > self.remaining:
+            n = self.remaining
+        data = self.stream.read(n)
+        self.remaining -= len(data)
+        return data
+
+
+def _upload_single(base: str, key: str, bucket: str, dest_path: str, stream: BinaryIO, size: int,
+                   content_type: str, upsert: bool, cache_control: Optional[str]):
+    headers = _headers(key, upsert)
+    headers["Content-Type"] = content_type
+    if cache_control:
+        headers["Cache-Control"] = f"max-age={cache_control}"
+
+    r = requests.post(
+        f"{base}/object/{bucket}/{dest_path}",
+        headers=headers,
+        data=_Window(stream, size),
+        timeout=STORAGE_UPLOAD_TIMEOUT,
+    )
+
+    if r.status_code not in (200, 201):
+        raise StorageUploadError(f"Upload failed ({r.status_code}): {r.text}")
+
+
+def _upload_resumable(base: str, key: str, bucket: str, dest_path: str, stream: BinaryIO, size: int,
+                      content_type: str, upsert: bool, cache_control: Optional[str]):
+    """
+    TUS upload in STORAGE_UPLOAD_CHUNK_BYTES pieces. A failed PATCH asks
+    the server for its offset and carries on from there.
+    """
+    headers = _headers(key, upsert)
+    headers["Tus-Resumable"] = "1.0.0"
+
+    metadata = {
+        "bucketName": bucket,
+        "objectName": dest_path,
+        "contentType": content_type,
+    }
+    if cache_control:
+        metadata["cacheControl"] = cache_control
+
+    r = requests.post(
+        f"{base}/upload/resumable",
+        headers={
+            **headers,
+            "Upload-Length": str(size),
+            "Upload-Metadata": ",".join(f"{k} {_b64(v)}" for k, v in metadata.items()),
+        },
+        timeout=STORAGE_UPLOAD_TIMEOUT,
+    )
+
+    if r.status_code != 201 or not r.headers.get("Location"):
+        raise StorageUploadError(f"Upload failed ({r.status_code}): {r.text}")
+
+    location = r.headers["Location"]
+    offset = 0
+    failures = 0
+
+    while offset < size:
+        length = min(STORAGE_UPLOAD_CHUNK_BYTES, size - offset)
+        stream.seek(offset)
+
+        try:
+            r = requests.patch(
+                location,
+                headers={
+                    **headers,
+                    "Upload-Offset": str(offset),
+                    "Content-Type": "application/offset+octet-stream",
+                },
+                data=_Window(stream, length),
+                timeout=STORAGE_UPLOAD_TIMEOUT,
+            )
+            ok = r.status_code == 204
+            error = f"({r.status_code}): {r.text}"
+
+        except requests.RequestException as e:
+            ok = False
+            error = str(e)
+
+        if ok:
+            offset = int(r.headers.get("Upload-Offset", offset + length))
+            failures = 0
+            continue
+
+        failures += 1
+        if failures > STORAGE_UPLOAD_RETRIES:
+            raise StorageUploadError(f"Upload failed at byte {offset} {error}")
+
+        time.sleep(failures)
+
+        # the server may have stored part of the chunk
+        head = requests.head(location, headers=headers, timeout=STORAGE_UPLOAD_TIMEOUT)
+        if head.status_code == 200 and head.headers.get("Upload-Offset"):
+            offset = int(head.headers["Upload-Offset"])
+
+
+def upload_stream(bucket: str, dest_path: str, stream: BinaryIO, size: int, content_type: str,
+                  upsert: bool = False, cache_control: Optional[str] = None):
+    """
+    Uploads size bytes from a seekable binary stream to a Supabase storage
+    bucket. Data is sent in fixed-size chunks, so memory use does not grow
+    with the file; anything larger than one chunk goes through the
+    resumable endpoint.
+    """
+    base, key = _storage_config()
+    args = (base, key, bucket, dest_path, stream, size, content_type, upsert, cache_control)
+
+    if size <= STORAGE_UPLOAD_CHUNK_BYTES:
+        _upload_single(*args)
+    else:
+        _upload_resumable(*args)
+
+
+def upload_path(bucket: str, file_path: Path, dest_path: str, content_type: str,
+                upsert: bool = False, cache_control: Optional[str] = None):
+    """upload_stream for a file on disk."""
+    file_path = Path(file_path)
+    with open(file_path, "rb") as f:
+        upload_stream(bucket, dest_path, f, file_path.stat().st_size, content_type, upsert, cache_control)
@@ -0,0 +1,78 @@
+import os
+import unicodedata
+from functools import lru_cache
+
+
+# lines / widths of scene text; a lesson only has a few hundred strings
+TEXT_LAYOUT_CACHE_SIZE = int(os.getenv("TEXT_LAYOUT_CACHE_SIZE", "4096"))
+
+DEVANAGARI = ("\u0900", "\u097f")
+VIRAMA = "\u094d"
+JOINERS = ("\u200c", "\u200d")  # ZWNJ / ZWJ
+
+
+def text_script(text: str) -> str:
+    """Which font set text needs: "devanagari" or "latin"."""
+    lo, hi = DEVANAGARI
+    return "devanagari" if any(lo <= ch <= hi for ch in text) else "latin"
+
+
+def safe_prefix(text: str, n: int) -> str:
+    """
+    text[:n], moved back so it never splits a syllable: a cut before a
+    vowel sign / nukta / anusvara, after a virama or around a joiner
+    would render a broken Devanagari cluster.
+    """
+    n = max(0, min(n, len(text)))
+
+    while 0 < n < len(text):
+        nxt, prev = text[n], text[n - 1]
+        if unicodedata.category(nxt).startswith("M") or nxt in JOINERS or prev == VIRAMA or prev in JOINERS:
+            n -= 1
+            continue
+        break
+
+    return text[:n]
+
+
+@lru_cache(maxsize=TEXT_LAYOUT_CACHE_SIZE * 8)
+def text_width(text: str, font) -> int:
+    """Right edge of text drawn at x=0 (what draw.textbbox(...)[2] gives)."""
+    return font.getbbox(text)[2]
+
+
+@lru_cache(maxsize=TEXT_LAYOUT_CACHE_SIZE)
+def layout_lines(text: str, font, max_width: int, max_lines: int = 6):
+    """
+    Greedy word wrap of text into at most max_lines lines no wider than
+    max_width (a single long word may overflow). Returns a tuple; fonts
+    are process-wide singletons, so (text, font, width) is a stable key.
+    """
+    lines = []
+    current = ""
+
+    for w in text.split():
+        test = (current + " " + w).strip()
+        if text_width(test, font) <= max_width:
+            current = test
+        else:
+            if current:
+                lines.append(current)
+            current = w
+
+            # rest would be cut by max_lines anyway
+            if len(lines) >= max_lines:
+                current = ""
+                break
+
+    if current:
+        lines.append(current)
+
+    return tuple(lines[:max_lines])
+
+
+def layout_cache_info() -> dict:
+    return {
+        "layout": layout_lines.cache_info()._asdict(),
+        "width": text_width.cache_info()._asdict(),
+    }
@@ -0,0 +1,146 @@
+"""
+Answer-sheet grading benchmark: two-step vs single-pass.
+
+Grades the same sheets with both GRADING_MODES against the real OpenAI
+API (needs OPENAI_API_KEY) and reports per mode the latency per sheet,
+model calls and prompt / completion tokens, plus how far the scores of
+the two modes differ. Nothing is uploaded or saved.
+
+Run from the repo root:
+    python -m benchmarks.bench_grading_modes sheets/*.jpg --subject Maths --out grading.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# answer_sheet_evaluator creates its clients at import time; Supabase is never called here
+os.environ.setdefault("SUPABASE_URL", "https://bench.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "bench")
+
+
+class UsageRecorder:
+    """Wraps client.chat.completions.create and keeps the usage of every call."""
+
+    def __init__(self, create):
+        self.create = create
+        self.calls = []
+
+    def __call__(self, **kwargs):
+        resp = self.create(**kwargs)
+        usage = getattr(resp, "usage", None)
+        self.calls.append({
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0),
+            "completion_tokens": getattr(usage, "completion_tokens", 0),
+        })
+        return resp
+
+
+def grade(ase, recorder: UsageRecorder, mode: str, image_bytes: bytes, subject: str, total_marks: int) -> dict:
+    """One sheet the way /evaluate grades it. Returns timings / usage / score."""
+    first_call = len(recorder.calls)
+    start = time.perf_counter()
+
+    graded = ase.grade_single_pass(image_bytes, subject, total_marks) if mode == "single" else None
+    fell_back = mode == "single" and graded is None
+
+    if graded:
+        ocr_text, raw = graded
+    else:
+        ocr_text = ase.extract_text_openai_vision(image_bytes)
+        raw = ase.evaluate_with_ai(ocr_text, subject, total_marks)
+
+    seconds = time.perf_counter() - start
+    calls = recorder.calls[first_call:]
+    row = ase.evaluation_row("bench", subject, total_marks, ocr_text, ase.parse_evaluation(raw), None, None)
+
+    return {
+        "seconds": round(seconds, 3),
+        "calls": len(calls),
+        "prompt_tokens": sum(c["prompt_tokens"] for c in calls),
+        "completion_tokens": sum(c["completion_tokens"] for c in calls),
+        "fell_back": fell_back,
+        "score": row["score"],
+        "ocr_chars": len(ocr_text),
+    }
+
+
+def summarize(items) -> dict:
+    return {
+        "sheets": len(items),
+        "median_seconds": round(statistics.median(i["seconds"] for i in items), 3),
+        "mean_seconds": round(statistics.mean(i["seconds"] for i in items), 3),
+        "calls": sum(i["calls"] for i in items),
+        "prompt_tokens": sum(i["prompt_tokens"] for i in items),
+        "completion_tokens": sum(i["completion_tokens"] for i in items),
+        "fallbacks": sum(i["fell_back"] for i in items),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sheets", nargs="+", type=Path, help="answer sheet images")
+    parser.add_argument("--subject", default="General")
+    parser.add_argument("--total-marks", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--out", type=Path, help="write the results here as JSON")
+    args = parser.parse_args()
+
+    from app.routers import answer_sheet_evaluator as ase
+
+    recorder = UsageRecorder(ase.client.chat.completions.create)
+    ase.client.chat.completions.create = recorder
+
+    sheets = [(p.name, p.read_bytes()) for p in args.sheets]
+    results = {mode: [] for mode in ase.GRADING_MODES}
+
+    for run in range(args.runs):
+        for name, data in sheets:
+            # alternate the order so neither mode always goes first
+            modes = ase.GRADING_MODES if run % 2 == 0 else ase.GRADING_MODES[::-1]
+            for mode in modes:
+                item = grade(ase, recorder, mode, data, args.subject, args.total_marks)
+                item["sheet"] = name
+                results[mode].append(item)
+                print(
+                    f"{name:30s} {mode:8s} {item['seconds']:6.2f}s  {item['calls']} calls"
+                    f"  {item['prompt_tokens']:6d} + {item['completion_tokens']:5d} tokens  score {item['score']}",
+                    file=sys.stderr
+                )
+
+    summary = {mode: summarize(items) for mode, items in results.items()}
+
+    two_step, single = results["two_step"], results["single"]
+    summary["mean_score_difference"] = round(
+        statistics.mean(abs(a["score"] - b["score"]) for a, b in zip(two_step, single)), 2
+    )
+
+    for mode in ase.GRADING_MODES:
+        s = summary[mode]
+        print(
+            f"{mode:8s} median {s['median_seconds']:6.2f}s/sheet  {s['calls']} calls"
+            f"  {s['prompt_tokens']} prompt + {s['completion_tokens']} completion tokens"
+            f"  ({s['fallbacks']} fallbacks)"
+        )
+    print(f"mean |score difference|: {summary['mean_score_difference']}")
+
+    if args.out:
+        args.out.write_text(json.dumps({
+            "meta": {
+                "subject": args.subject,
+                "total_marks": args.total_marks,
+                "runs": args.runs,
+                "sheet_bytes": {name: len(data) for name, data in sheets},
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            },
+            "summary": summary,
+            "items": results,
+        }, indent=2))
+        print(f"results -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Scene frame render benchmark.
+
+Compares the old per-frame full redraw (plate rebuilt every frame) with
+the layered SceneRenderer that builds the plate once per scene.
+
+Run from the repo root:
+    python -m benchmarks.bench_scene_render --frames 120
+"""
+import argparse
+import os
+import time
+
+# video_generation creates its clients at import time; nothing is called here
+os.environ.setdefault("GROQ_API_KEY", "bench")
+os.environ.setdefault("SUPABASE_URL", "https://bench.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "bench")
+
+from app.routers.video_generation import SceneRenderer  # noqa: E402
+
+SCENE = {
+    "subtitle": "Adding fractions with the same denominator",
+    "narration": "When denominators are the same, we simply add the numerators "
+                 "and keep the denominator. Let us solve one example together.",
+    "example": {
+        "question": "What is 2/7 + 3/7?",
+        "steps": [
+            "Denominators are same: 7",
+            "Add numerators: 2 + 3 = 5",
+            "Keep denominator 7",
+            "Answer: 5/7",
+        ],
+    },
+}
+
+
+def bench_full_redraw(frames: int, fps: int, scene_dur: float) -> float:
+    start = time.perf_counter()
+    for f in range(frames):
+        SceneRenderer(SCENE, f % 4, scene_dur).render(f / fps)
+    return frames / (time.perf_counter() - start)
+
+
+def bench_layered(frames: int, fps: int, scene_dur: float) -> float:
+    start = time.perf_counter()
+    renderer = SceneRenderer(SCENE, 0, scene_dur)
+    for f in range(frames):
+        renderer.render(f / fps)
+    return frames / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=120)
+    parser.add_argument("--fps", type=int, default=6)
+    parser.add_argument("--scene-dur", type=float, default=6.0)
+    args = parser.parse_args()
+
+    before = bench_full_redraw(args.frames, args.fps, args.scene_dur)
+    after = bench_layered(args.frames, args.fps, args.scene_dur)
+
+    print(f"full redraw : {before:8.1f} frames/sec")
+    print(f"layered     : {after:8.1f} frames/sec")
+    print(f"speedup     : {after / before:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Answer-sheet image preprocessing benchmark.
+
+For every sheet: bytes of the base64 image sent to OpenAI before (raw
+upload) and after prepare_sheet_image, and the preprocessing time.
+With --ocr it also runs extract_text_openai_vision on both versions
+(needs OPENAI_API_KEY) and reports latency and prompt tokens.
+
+Without sheet paths a synthetic 12 MP phone photo of a written page is
+used, so the byte / time numbers can be taken offline.
+
+Run from the repo root:
+    python -m benchmarks.bench_sheet_images sheets/*.jpg --ocr --out images.json
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import statistics
+import time
+from pathlib import Path
+
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+from app.services.sheet_image import SHEET_FORMAT, SHEET_MAX_EDGE, crop_margins, prepare_sheet_image
+
+# answer_sheet_evaluator creates its clients at import time; Supabase is never called here
+os.environ.setdefault("SUPABASE_URL", "https://bench.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "bench")
+
+
+def synthetic_photo(seed: int = 0) -> bytes:
+    """4000x3000 JPEG of a ruled page with writing on a darker desk, stored sideways (EXIF 6)."""
+    rnd = random.Random(seed)
+    im = Image.new("RGB", (4000, 3000), (96, 72, 60))
+    draw = ImageDraw.Draw(im)
+    draw.rectangle((300, 180, 3700, 2820), fill=(236, 232, 222))
+
+    try:
+        font = ImageFont.truetype("DejaVuSans.ttf", 56)
+    except OSError:
+        font = ImageFont.load_default()
+
+    words = "fraction numerator denominator add equal parts answer whole LCM step".split()
+    for k, y in enumerate(range(300, 2700, 90)):
+        draw.line((360, y + 70, 3640, y + 70), fill=(170, 190, 215), width=3)
+        line = " ".join(rnd.choice(words) for _ in range(rnd.randint(4, 9)))
+        draw.text((420, y), f"{k + 1}. {line}", font=font, fill=(30, 40, 90))
+
+    # sensor noise, as in a real photo (and what makes phone JPEGs big)
+    noise = Image.effect_noise(im.size, 24).convert("RGB")
+    im = Image.blend(im, noise, 0.08)
+
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotate 90 on display
+    out = io.BytesIO()
+    im.rotate(90, expand=True).save(out, "JPEG", quality=92, exif=exif)
+    return out.getvalue()
+
+
+def b64_len(data: bytes) -> int:
+    return len(base64.b64encode(data))
+
+
+def bench_sheet(name: str, data: bytes, repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        prepared, mime = prepare_sheet_image(data)
+        times.append(time.perf_counter() - start)
+
+    with Image.open(io.BytesIO(data)) as im:
+        before_size = im.size
+        upright = ImageOps.exif_transpose(im).convert("L")
+    with Image.open(io.BytesIO(prepared)) as im:
+        after_size = im.size
+
+    return {
+        "sheet": name,
+        "before": {"bytes": len(data), "request_bytes": b64_len(data), "size": before_size},
+        "after": {"bytes": len(prepared), "request_bytes": b64_len(prepared), "size": after_size, "mime": mime},
+        "cropped": crop_margins(upright).size != upright.size,
+        "prepare_seconds": round(statistics.median(times), 4),
+    }, prepared, mime
+
+
+def ocr_timing(ase, recorder, data: bytes, mime: str) -> dict:
+    first = len(recorder.calls)
+    start = time.perf_counter()
+    text = ase.extract_text_openai_vision(data, mime)
+    seconds = time.perf_counter() - start
+    return {
+        "seconds": round(seconds, 3),
+        "prompt_tokens": sum(c["prompt_tokens"] for c in recorder.calls[first:]),
+        "chars": len(text),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sheets", nargs="*", type=Path, help="answer sheet images (default: synthetic photo)")
+    parser.add_argument("--repeat", type=int, default=3, help="preprocessing runs per sheet (median)")
+    parser.add_argument("--ocr", action="store_true", help="also time OpenAI OCR before / after")
+    parser.add_argument("--out", type=Path, help="write the results here as JSON")
+    args = parser.parse_args()
+
+    if args.sheets:
+        sheets = [(p.name, p.read_bytes()) for p in args.sheets]
+    else:
+        sheets = [("synthetic-12mp.jpg", synthetic_photo())]
+
+    if args.ocr:
+        from app.routers import answer_sheet_evaluator as ase
+        from benchmarks.bench_grading_modes import UsageRecorder
+
+        recorder = UsageRecorder(ase.client.chat.completions.create)
+        ase.client.chat.completions.create = recorder
+
+    items = []
+    for name, data in sheets:
+        item, prepared, mime = bench_sheet(name, data, args.repeat)
+
+        if args.ocr:
+            item["before"]["ocr"] = ocr_timing(ase, recorder, data, "image/png")
+            item["after"]["ocr"] = ocr_timing(ase, recorder, prepared, mime)
+
+        before, after = item["before"], item["after"]
+        line = (
+            f"{name:28s} {before['request_bytes'] / 1024:9.1f} KB -> {after['request_bytes'] / 1024:7.1f} KB"
+            f"  ({before['size'][0]}x{before['size'][1]} -> {after['size'][0]}x{after['size'][1]})"
+            f"  {'cropped' if item['cropped'] else 'not cropped':11s}"
+            f"  prepare {item['prepare_seconds'] * 1000:6.1f} ms"
+        )
+        if args.ocr:
+            line += f"  ocr {before['ocr']['seconds']:.2f}s -> {item['prepare_seconds'] + after['ocr']['seconds']:.2f}s"
+        print(line)
+        items.append(item)
+
+    # the synthetic page lies on a desk: no crop means the paper was not found
+    if not args.sheets and not items[0]["cropped"]:
+        raise SystemExit("synthetic photo was not cropped")
+
+    total_before = sum(i["before"]["request_bytes"] for i in items)
+    total_after = sum(i["after"]["request_bytes"] for i in items)
+    print(f"request bytes: {total_before} -> {total_after} ({total_before / max(total_after, 1):.1f}x smaller)")
+
+    if args.out:
+        args.out.write_text(json.dumps({
+            "meta": {"max_edge": SHEET_MAX_EDGE, "format": SHEET_FORMAT, "time": time.strftime("%Y-%m-%dT%H:%M:%S%z")},
+            "items": items,
+        }, indent=2))
+        print(f"results -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
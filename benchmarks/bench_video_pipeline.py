@@ -0,0 +1,370 @@
+"""
+Video pipeline benchmark (offline).
+
+Runs the render pipeline stage by stage on a canned lesson with Groq and
+Edge TTS stubbed out, and reports per stage: wall time, peak RSS (this
+process + ffmpeg / render pool children), bytes written to disk by the
+same processes (scratch deleted within the stage included) and bytes
+left on disk.
+
+    lesson   generate_lesson (stub Groq answers with the fixture JSON)
+    tts      generate_scene_audio (stub TTS: silent CBR MP3 + word timings)
+    render   build_video_segments (frames + per-scene encode), frames/sec
+    concat   concat_segments (final MP4)
+
+Nothing is uploaded. Needs ffmpeg on PATH and /proc (Linux).
+
+Run from the repo root:
+    python -m benchmarks.bench_video_pipeline --profile final --runs 3 --out bench.json
+
+Every run starts with an empty media cache unless --warm is given (then
+runs after the first one show the cached path). Compare two result files
+with any JSON diff; "meta" records what the numbers were measured on.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from types import SimpleNamespace
+
+from app.services.disk_lifecycle import remove_path
+
+FIXTURE = Path(__file__).resolve().parent / "fixtures" / "lesson_fractions.json"
+
+# stub TTS: speaking rate and the pause Edge TTS leaves after the last word
+STUB_WORD_SECONDS = 0.3
+STUB_TAIL_SECONDS = 0.4
+RSS_SAMPLE_SECONDS = 0.05
+
+
+# =========================
+# STUBS
+# =========================
+class StubGroq:
+    """Stands in for groq_client: every completion is the fixture lesson."""
+
+    def __init__(self, fixture: Path):
+        text = fixture.read_text(encoding="utf-8")
+        message = SimpleNamespace(content=text)
+        response = SimpleNamespace(choices=[SimpleNamespace(message=message)])
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=lambda **kw: response))
+
+
+async def stub_tts_generate(text: str, out_path: Path):
+    """
+    edge_tts_generate stand-in: silence in Edge TTS's output format
+    (24 kHz mono, 48 kbit/s CBR MP3) lasting as long as the words take,
+    plus WordBoundary-style timings.
+    """
+    words = text.split()
+    duration = len(words) * STUB_WORD_SECONDS + STUB_TAIL_SECONDS
+
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-v", "error", "-y",
+        "-f", "lavfi", "-i", "anullsrc=r=24000:cl=mono",
+        "-t", f"{duration:.3f}",
+        "-c:a", "libmp3lame", "-b:a", "48k",
+        str(out_path),
+    )
+    if await proc.wait() != 0:
+        raise RuntimeError(f"stub TTS: ffmpeg failed for {out_path}")
+
+    return [
+        (k * STUB_WORD_SECONDS, (k + 1) * STUB_WORD_SECONDS - 0.05, w)
+        for k, w in enumerate(words)
+    ]
+
+
+# =========================
+# MEASUREMENT
+# =========================
+def _children_map():
+    """ppid -> [pid] for every process visible in /proc."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # comm may contain spaces / parens: fields start after the last ")"
+        ppid = int(stat.rsplit(b")", 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    return children
+
+
+def _rss_bytes(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def _write_bytes(pid: int) -> int:
+    """Bytes pid sent to the page cache for storage, reaped children included."""
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            for line in f:
+                if line.startswith("write_bytes:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _tree_sum(read, root: int = None) -> int:
+    root = root or os.getpid()
+    children = _children_map()
+    total, stack = 0, [root]
+    while stack:
+        pid = stack.pop()
+        total += read(pid)
+        stack.extend(children.get(pid, ()))
+    return total
+
+
+def tree_rss_bytes(root: int = None) -> int:
+    """RSS of root and all its descendants (ffmpeg, render pool workers)."""
+    return _tree_sum(_rss_bytes, root)
+
+
+def tree_write_bytes(root: int = None) -> int:
+    """
+    write_bytes of root and all its descendants. The kernel adds a reaped
+    child's count to its parent's, so the difference of two readings also
+    covers ffmpeg runs that ended in between.
+    """
+    return _tree_sum(_write_bytes, root)
+
+
+class PeakRss:
+    """Samples tree_rss_bytes() on a thread while the block runs."""
+
+    def __init__(self, interval: float = RSS_SAMPLE_SECONDS):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while True:
+            self.peak = max(self.peak, tree_rss_bytes())
+            if self._stop.wait(self.interval):
+                break
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, tree_rss_bytes())
+
+
+def dir_bytes(*roots) -> int:
+    total = 0
+    for root in roots:
+        for dirpath, _, names in os.walk(root):
+            for name in names:
+                try:
+                    total += os.stat(os.path.join(dirpath, name)).st_size
+                except FileNotFoundError:
+                    continue
+    return total
+
+
+def run_stage(name: str, results: dict, disk_roots, fn, *args):
+    """Runs fn(*args), records its time / peak RSS / disk writes / disk growth under results[name]."""
+    before = dir_bytes(*disk_roots)
+    written = tree_write_bytes()
+    with PeakRss() as rss:
+        start = time.perf_counter()
+        out = fn(*args)
+        seconds = time.perf_counter() - start
+
+    results[name] = {
+        "seconds": round(seconds, 3),
+        "peak_rss_bytes": rss.peak,
+        # everything written, including scratch (frame PNGs) deleted again
+        "disk_bytes_written": tree_write_bytes() - written,
+        # net growth of the output / cache dirs
+        "disk_bytes_retained": dir_bytes(*disk_roots) - before,
+    }
+    return out
+
+
+# =========================
+# PIPELINE
+# =========================
+def run_once(vg, cache, profile: str, workers: int, disk_roots) -> dict:
+    """One full render of the fixture lesson. Returns per-stage results."""
+    video_id = f"bench-{uuid.uuid4().hex[:8]}"
+    stages = {}
+
+    vg.get_media_cache = lambda: cache
+    try:
+        lesson = run_stage(
+            "lesson", stages, disk_roots,
+            vg.get_or_generate_lesson, "Fractions", 5, "hinglish"
+        )
+
+        final_audio = vg.AUDIO_DIR / f"{video_id}.mp3"
+        scene_durs, clip_paths, clip_keys, scene_words = run_stage(
+            "tts", stages, disk_roots,
+            vg.generate_scene_audio, video_id, lesson, final_audio
+        )
+
+        seg_paths = run_stage(
+            "render", stages, disk_roots,
+            lambda: vg.build_video_segments(
+                video_id, lesson, scene_durs, clip_paths, clip_keys, scene_words,
+                profile=profile, workers=workers
+            )
+        )
+
+        out_mp4 = vg.VIDEOS_DIR / f"{video_id}.mp4"
+        out_mp4.parent.mkdir(parents=True, exist_ok=True)
+        run_stage("concat", stages, disk_roots, vg.concat_segments, seg_paths, out_mp4)
+
+        fps = vg.RENDER_PROFILES[profile]["fps"]
+        frames = sum(vg.scene_frame_count(d, fps) for d in scene_durs)
+        render = stages["render"]
+        render["frames"] = frames
+        render["frames_per_sec"] = round(frames / render["seconds"], 1)
+
+        return {
+            "stages": stages,
+            "total_seconds": round(sum(s["seconds"] for s in stages.values()), 3),
+            "video_seconds": round(sum(scene_durs), 2),
+            "video_bytes": out_mp4.stat().st_size,
+        }
+
+    finally:
+        for p in vg.render_job_paths(video_id):
+            remove_path(p)
+
+
+def ffmpeg_version() -> str:
+    try:
+        out = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True, check=True).stdout
+        return out.splitlines()[0]
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def summarize(runs) -> dict:
+    """Median of every numeric stage field over the runs."""
+    def median(values):
+        values = sorted(values)
+        mid = len(values) // 2
+        return values[mid] if len(values) % 2 else (values[mid - 1] + values[mid]) / 2
+
+    out = {}
+    for name in runs[0]["stages"]:
+        fields = runs[0]["stages"][name]
+        out[name] = {k: median([r["stages"][name][k] for r in runs]) for k in fields}
+    out["total_seconds"] = median([r["total_seconds"] for r in runs])
+    return out
+
+
+def print_run(i: int, run: dict):
+    print(f"run {i}: {run['total_seconds']:.2f}s for {run['video_seconds']:.1f}s of video")
+    for name, s in run["stages"].items():
+        extra = f"  {s['frames_per_sec']:7.1f} frames/sec" if "frames_per_sec" in s else ""
+        print(
+            f"  {name:7s} {s['seconds']:7.2f}s"
+            f"  peak rss {s['peak_rss_bytes'] / 2**20:7.1f} MB"
+            f"  disk written {s['disk_bytes_written'] / 2**20:7.2f} MB"
+            f"  retained {s['disk_bytes_retained'] / 2**20:7.2f} MB{extra}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", default="final")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--mode", default=os.getenv("VIDEO_RENDER_MODE", "stream"))
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--warm", action="store_true", help="keep the media cache between runs")
+    parser.add_argument("--fixture", type=Path, default=FIXTURE)
+    parser.add_argument("--out", type=Path, help="write the results here as JSON")
+    args = parser.parse_args()
+
+    scratch = Path(tempfile.mkdtemp(prefix="bench-video-"))
+
+    # read by video_generation at import time; clients are stubbed below
+    os.environ.setdefault("GROQ_API_KEY", "bench")
+    os.environ.setdefault("SUPABASE_URL", "https://bench.supabase.co")
+    os.environ.setdefault("SUPABASE_KEY", "bench")
+    os.environ["MEDIA_CACHE_DIR"] = str(scratch / "cache")
+    os.environ["VIDEO_RENDER_WORKERS"] = str(args.workers)
+    os.environ["VIDEO_RENDER_MODE"] = args.mode
+
+    from app.routers import video_generation as vg
+    from app.services.media_cache import LocalDiskCache
+
+    if args.profile not in vg.RENDER_PROFILES:
+        parser.error(f"--profile must be one of {', '.join(vg.RENDER_PROFILES)}")
+
+    vg.groq_client = StubGroq(args.fixture)
+    vg.edge_tts_generate = stub_tts_generate
+
+    disk_roots = (vg.OUT_DIR, scratch)
+    runs = []
+
+    try:
+        cache = None
+        for i in range(args.runs):
+            if cache is None or not args.warm:
+                cache = LocalDiskCache(scratch / f"cache-{i}", 1 << 40)
+            run = run_once(vg, cache, args.profile, args.workers, disk_roots)
+            print_run(i + 1, run)
+            runs.append(run)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    import PIL
+
+    result = {
+        "meta": {
+            "profile": args.profile,
+            "settings": vg.RENDER_PROFILES[args.profile],
+            "workers": args.workers,
+            "mode": args.mode,
+            "warm_cache": args.warm,
+            "fixture": args.fixture.name,
+            "render_version": vg.VIDEO_RENDER_VERSION,
+            "cpu_count": os.cpu_count(),
+            "machine": platform.machine(),
+            "python": sys.version.split()[0],
+            "pillow": PIL.__version__,
+            "ffmpeg": ffmpeg_version(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "runs": runs,
+        "median": summarize(runs),
+    }
+
+    if args.out:
+        args.out.write_text(json.dumps(result, indent=2))
+        print(f"results -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()